@@ -0,0 +1,156 @@
+"""
+Serving uploaded attachments with ETags, conditional requests, byte ranges and long-lived caching
+"""
+import asyncio
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path, PurePosixPath, PureWindowsPath
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from starlette.types import Receive, Scope, Send
+
+import storage
+
+# Content-addressed blobs never change, so caches may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Uploads stored before content addressing ("{channel_id}_{filename}") can be overwritten
+MUTABLE_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+CHUNK_SIZE = 256 * 1024
+
+# Blobs and their derived thumbnails ("<sha256>.thumb.webp") are both named after the content
+_BLOB_PATH = re.compile(r"[0-9a-f]{2}/([0-9a-f]{64}(?:\.thumb)?)(\.[a-z0-9]{1,10})?")
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def resolve(path: str) -> Optional[Path]:
+    """Map a URL path under /uploads to a stored file, refusing traversal and hidden files"""
+    # "//etc/passwd", "%2Fetc%2Fpasswd" and "C:\..." would make joinpath discard UPLOAD_DIR
+    if PurePosixPath(path).is_absolute() or PureWindowsPath(path).drive or PureWindowsPath(path).root:
+        return None
+    parts = Path(path).parts
+    if not parts or any(part in ("..", "") or part.startswith(".") for part in parts):
+        return None
+    file_path = storage.UPLOAD_DIR.joinpath(*parts)
+    if not file_path.resolve().is_relative_to(storage.UPLOAD_DIR.resolve()):
+        return None
+    return file_path if file_path.is_file() else None
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """Return the inclusive (start, end) of a single byte range; None to serve the whole file.
+
+    Raises ValueError for a well-formed but unsatisfiable range.
+    """
+    match = _RANGE.fullmatch(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None  # Malformed or multi-range requests get the full file
+    first, last = match.groups()
+    if first == "":
+        length = int(last)  # Suffix range: the last N bytes
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class AttachmentResponse(Response):
+    """Streams a byte range of a file, using zero-copy sendfile when the server offers it"""
+
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.end < self.start:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        count = self.end - self.start + 1
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": count,
+                })
+                return
+            file.seek(self.start)
+            while count > 0:
+                chunk = await asyncio.to_thread(file.read, min(CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+            if count > 0:
+                await send({"type": "http.response.body", "body": b""})
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve(request: Request, path: str) -> Response:
+    """Build the response for GET/HEAD /uploads/{path}"""
+    file_path = resolve(path)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    stat = os.stat(file_path)
+
+    blob = _BLOB_PATH.fullmatch(path)
+    if blob:
+        # The name is the SHA-256 of the content, which makes a strong validator
+        etag = f'"{blob.group(1)}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        cache_control = MUTABLE_CACHE_CONTROL
+
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+        "x-content-type-options": "nosniff",
+    }
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+    start, end, status_code = 0, stat.st_size - 1, 200
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range validator means the client's partial copy is outdated: send everything
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat.st_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{stat.st_size}"
+
+    return AttachmentResponse(file_path, start, end, status_code, headers, media_type)
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark: CPU cost of one channel broadcast through the broker
+
+Compares the original single-process path (one json.dumps per broadcast,
+the same string sent to every local socket) with the serialize-once
+Event path through a broker frame, whose routing header lets the
+receiving worker deliver without decoding the JSON. The Event path is
+measured with the stdlib encoder and with the fast encoder when one is
+installed. Both paths fan out through the same per-connection queues,
+so the difference is the encoding and framing work. Run from the backend
+directory:
+
+    python benchmarks/bench_broadcast.py --recipients 1000 --rounds 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import events  # noqa: E402
+from connections import Connection  # noqa: E402
+
+
+class NullWebSocket:
+    """Stands in for a client socket; frames are discarded"""
+
+    async def send_text(self, data: str):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_payload(i: int) -> dict:
+    return {
+        "type": "message",
+        "id": i,
+        "username": "benchmark-user",
+        "content": "The quick brown fox jumps over the lazy dog " * 4,
+        "file_url": None,
+        "timestamp": datetime.now(timezone.utc),
+    }
+
+
+async def drain(connections: list):
+    while any(connection._queue for connection in connections):
+        await asyncio.sleep(0)
+
+
+async def run_legacy(connections: list, rounds: int) -> float:
+    start = time.process_time()
+    for i in range(rounds):
+        payload = make_payload(i)
+        payload["timestamp"] = payload["timestamp"].isoformat()
+        message_str = json.dumps(payload)
+        event = events.Event(payload, data=message_str.encode())
+        for connection in connections:
+            connection.enqueue(event)
+        await drain(connections)
+    return time.process_time() - start
+
+
+async def run_events(connections: list, rounds: int, dumps) -> float:
+    start = time.process_time()
+    for i in range(rounds):
+        payload = make_payload(i)
+        frame = events.pack_frame(events.Event(payload, data=dumps(payload)))
+        event, _ = events.unpack_frame(frame)
+        for connection in connections:
+            connection.enqueue(event)
+        await drain(connections)
+    return time.process_time() - start
+
+
+async def main(recipients: int, rounds: int, binary: bool):
+    connections = [Connection(NullWebSocket(), user_id, binary=binary) for user_id in range(recipients)]
+    for connection in connections:
+        connection.start()
+
+    def stdlib_dumps(payload):
+        return json.dumps(payload, default=events._default, separators=(",", ":")).encode()
+
+    results = {"legacy": await run_legacy(connections, rounds)}
+    results["event_stdlib"] = await run_events(connections, rounds, stdlib_dumps)
+    if events.ORJSON_AVAILABLE or events.MSGSPEC_AVAILABLE:
+        results["event_fast"] = await run_events(connections, rounds, events.dumps)
+
+    for connection in connections:
+        connection.stop()
+
+    report = {
+        "recipients": recipients,
+        "rounds": rounds,
+        "binary_frames": binary,
+        "cpu_us_per_broadcast": {name: round(total / rounds * 1e6, 1) for name, total in results.items()},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--binary", action="store_true", help="Send binary frames instead of text")
+    args = parser.parse_args()
+    asyncio.run(main(args.recipients, args.rounds, args.binary))
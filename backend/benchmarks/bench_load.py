@@ -0,0 +1,315 @@
+"""
+Benchmark: end-to-end load on the chat backend - throughput and p50/p95/p99 latency
+
+Starts the FastAPI app under uvicorn in this process against a throwaway
+SQLite database, then runs each scenario in turn over real HTTP and
+WebSocket connections:
+
+    websocket  clients per channel sending typing frames and messages;
+               ack = durable write, delivery = the message's broadcast
+               arriving back at its sender
+    login      POST /token
+    history    GET /channels/{id}/messages (the "open channel" request)
+    ask_bot    POST /ask-bot
+
+and prints one JSON report (also written to --output) with a /metrics
+snapshot. Given --baseline (an earlier --output), it exits with status 1
+when any scenario's p95 latency or throughput is more than
+--max-regression percent worse than the baseline, and always when a
+scenario's error rate exceeds --max-error-rate. Needs the packages in
+benchmarks/requirements.txt. Run from the backend directory:
+
+    python benchmarks/bench_load.py --channels 4 --clients 10 --messages 20 --output baseline.json
+    python benchmarks/bench_load.py --channels 4 --clients 10 --messages 20 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import websockets
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+PASSWORD = "benchmark-password"
+QUESTIONS = [
+    "How do I create a server?",
+    "how can i upload a file",
+    "What is a channel?",
+    "Can I see who is typing?",
+    "what's the weather like",
+]
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Nearest-rank p50/p95/p99 and max, in milliseconds"""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, int(p / 100 * len(ordered) + 0.5) - 1))] * 1000, 2)
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": round(ordered[-1] * 1000, 2)}
+
+
+def checked(response: httpx.Response, action: str) -> httpx.Response:
+    """Abort the run with a readable error when a fixture request fails"""
+    if response.status_code >= 400:
+        raise SystemExit(f"Setup failed: {action} returned {response.status_code}: {response.text}")
+    return response
+
+
+def scenario_summary(scenario: dict) -> dict:
+    """The figures compared against a baseline: error rate, throughput and p95 latencies"""
+    if scenario["scenario"] == "websocket":
+        return {
+            "error_rate": scenario["lost"] / max(scenario["messages"], 1),
+            "throughput": scenario["throughput_msgs_per_s"],
+            "p95": {"ack": scenario["ack_latency_ms"]["p95"], "delivery": scenario["delivery_latency_ms"]["p95"]},
+        }
+    return {
+        "error_rate": scenario["errors"] / max(scenario["requests"], 1),
+        "throughput": scenario["throughput_rps"],
+        "p95": {"latency": scenario["latency_ms"]["p95"]},
+    }
+
+
+def find_regressions(report: dict, baseline: Optional[dict], max_regression: float, max_error_rate: float) -> list[str]:
+    """Describe every scenario that got worse than allowed; empty when the run passes"""
+    previous = {s["scenario"]: scenario_summary(s) for s in baseline["scenarios"]} if baseline else {}
+    allowed = 1 + max_regression / 100
+    problems = []
+    for scenario in report["scenarios"]:
+        name = scenario["scenario"]
+        current = scenario_summary(scenario)
+        if current["error_rate"] > max_error_rate:
+            problems.append(f"{name}: error rate {current['error_rate']:.1%} exceeds {max_error_rate:.1%}")
+        before = previous.get(name)
+        if before is None:
+            continue
+        if before["throughput"] and current["throughput"] * allowed < before["throughput"]:
+            problems.append(f"{name}: throughput {current['throughput']} < baseline {before['throughput']}")
+        for kind, p95 in current["p95"].items():
+            base = before["p95"].get(kind)
+            if p95 is not None and base and p95 > base * allowed:
+                problems.append(f"{name}: {kind} p95 {p95}ms > baseline {base}ms")
+    return problems
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_http(name: str, send, total: int, concurrency: int) -> dict:
+    """Issue `total` requests from `concurrency` workers; `send(i)` returns an httpx.Response"""
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            start = time.perf_counter()
+            try:
+                response = await send(i)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def run_websocket_client(url: str, client_id: int, messages: int, interval: float,
+                               typing_per_message: int, ack_latencies: list, delivery_latencies: list,
+                               timeout: float) -> int:
+    """One chat client; returns how many of its messages never came back"""
+    sent_at: dict[str, float] = {}
+    pending: set[str] = set()
+    async with websockets.connect(url) as ws:
+        async def receive():
+            async for frame in ws:
+                event = json.loads(frame)
+                if event.get("type") == "ack" and event.get("nonce") in sent_at:
+                    ack_latencies.append(time.perf_counter() - sent_at[event["nonce"]])
+                elif event.get("type") == "message" and event.get("content") in pending:
+                    pending.discard(event["content"])
+                    delivery_latencies.append(time.perf_counter() - sent_at[event["content"]])
+                    if not pending and len(sent_at) == messages:
+                        return
+
+        receiver = asyncio.create_task(receive())
+        for i in range(messages):
+            for _ in range(typing_per_message):
+                await ws.send(json.dumps({"type": "typing"}))
+            content = f"benchmark message {client_id}-{i}"
+            sent_at[content] = time.perf_counter()
+            pending.add(content)
+            await ws.send(json.dumps({"type": "message", "content": content, "nonce": content}))
+            await asyncio.sleep(interval)
+        try:
+            await asyncio.wait_for(receiver, timeout)
+        except asyncio.TimeoutError:
+            pass
+    return len(pending)
+
+
+async def run_websockets(base_url: str, tokens: list[str], channel_ids: list[int], clients: int,
+                         messages: int, interval: float, typing_per_message: int) -> dict:
+    ack_latencies, delivery_latencies = [], []
+    ws_base = base_url.replace("http://", "ws://")
+    jobs = []
+    for c, channel_id in enumerate(channel_ids):
+        for k in range(clients):
+            client_id = c * clients + k
+            url = f"{ws_base}/ws/{channel_id}?token={tokens[client_id]}"
+            jobs.append(run_websocket_client(url, client_id, messages, interval, typing_per_message,
+                                             ack_latencies, delivery_latencies, timeout=30))
+    start = time.perf_counter()
+    lost = sum(await asyncio.gather(*jobs))
+    elapsed = time.perf_counter() - start
+    total = len(jobs) * messages
+    return {
+        "scenario": "websocket",
+        "channels": len(channel_ids),
+        "clients_per_channel": clients,
+        "messages": total,
+        "typing_frames": total * typing_per_message,
+        "lost": lost,
+        "throughput_msgs_per_s": round(total / elapsed, 1),
+        "fanout_deliveries_per_s": round(total * clients / elapsed, 1),
+        "ack_latency_ms": percentiles(ack_latencies),
+        "delivery_latency_ms": percentiles(delivery_latencies),
+    }
+
+
+async def main(args):
+    import uvicorn
+    import main as app_module
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    # A failed fixture request exits the run, but the server still has to shut down cleanly
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            # --- Fixtures: one account per WebSocket client, a server and its channels ---
+            users = args.channels * args.clients
+            registered = await asyncio.gather(*[
+                client.post("/register/", json={"username": f"bench{i}", "email": f"bench{i}@example.com", "password": PASSWORD})
+                for i in range(users)
+            ])
+            for i, response in enumerate(registered):
+                checked(response, f"registering bench{i}")
+            tokens = []
+            for i in range(users):
+                response = await client.post("/token", data={"username": f"bench{i}@example.com", "password": PASSWORD})
+                tokens.append(checked(response, f"logging in bench{i}").json()["access_token"])
+            headers = {"Authorization": f"Bearer {tokens[0]}"}
+            response = await client.post("/servers", json={"name": "benchmark"}, headers=headers)
+            server_id = checked(response, "creating the server").json()["id"]
+            channel_ids = []
+            for c in range(args.channels):
+                response = await client.post(f"/servers/{server_id}/channels", json={"name": f"load-{c}"}, headers=headers)
+                channel_ids.append(checked(response, f"creating channel load-{c}").json()["id"])
+
+            scenarios = [await run_websockets(base_url, tokens, channel_ids, args.clients, args.messages,
+                                              args.interval_ms / 1000, args.typing)]
+            scenarios.append(await run_http(
+                "login",
+                lambda i: client.post("/token", data={"username": f"bench{i % users}@example.com", "password": PASSWORD}),
+                args.logins, args.concurrency,
+            ))
+            scenarios.append(await run_http(
+                "history",
+                lambda i: client.get(f"/channels/{channel_ids[i % len(channel_ids)]}/messages"),
+                args.requests, args.concurrency,
+            ))
+            scenarios.append(await run_http(
+                "ask_bot",
+                lambda i: client.post("/ask-bot", json={"question": QUESTIONS[i % len(QUESTIONS)]},
+                                      headers={"Authorization": f"Bearer {tokens[i % users]}"}),
+                args.requests, args.concurrency,
+            ))
+            metrics = (await client.get("/metrics")).json()
+    finally:
+        server.should_exit = True
+        await serving
+
+    report = {
+        "config": {
+            "channels": args.channels,
+            "clients_per_channel": args.clients,
+            "messages_per_client": args.messages,
+            "http_concurrency": args.concurrency,
+            "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+        },
+        "scenarios": scenarios,
+        "metrics": metrics,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=10, help="WebSocket clients per channel")
+    parser.add_argument("--messages", type=int, default=20, help="Messages sent by each client")
+    parser.add_argument("--interval-ms", type=float, default=50, help="Pause between a client's messages")
+    parser.add_argument("--typing", type=int, default=3, help="Typing frames sent before each message")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per history / ask-bot scenario")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent HTTP requests")
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", help="A previous --output report to compare against")
+    parser.add_argument("--max-regression", type=float, default=20,
+                        help="Allowed p95 latency / throughput regression against --baseline, in percent")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="Highest share of failed requests or lost messages per scenario")
+    args = parser.parse_args()
+    if args.output:
+        args.output = str(Path(args.output).resolve())
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    # Everything the app writes (database, uploads, bot and search indexes) goes to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="discord-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.chdir(workdir)
+    report = asyncio.run(main(args))
+
+    regressions = find_regressions(report, baseline, args.max_regression, args.max_error_rate)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,58 @@
+"""
+Benchmark: password verification (login) throughput per core
+
+Runs concurrent bcrypt verifications through PasswordHasher for each worker
+count and reports logins/second overall and per worker. Run from the
+backend directory:
+
+    python benchmarks/bench_login.py --rounds 12 --logins 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hashing  # noqa: E402
+
+
+async def measure(workers: int, rounds: int, logins: int) -> dict:
+    hasher = hashing.PasswordHasher(workers=workers, queue_limit=logins, rounds=rounds)
+    stored = hashing.get_password_hash("correct horse battery staple", rounds=rounds)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        hasher.verify("correct horse battery staple", stored) for _ in range(logins)
+    ])
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+    assert all(results)
+    return {
+        "workers": workers,
+        "logins_per_second": round(logins / elapsed, 1),
+        "logins_per_second_per_worker": round(logins / elapsed / workers, 1),
+        "mean_ms": round(elapsed / logins * workers * 1000, 2),
+    }
+
+
+async def main(rounds: int, logins: int, max_workers: int):
+    worker_counts = sorted({1, 2, max_workers})
+    report = {
+        "bcrypt_rounds": rounds,
+        "logins": logins,
+        "cpu_count": os.cpu_count(),
+        "results": [await measure(workers, rounds, logins) for workers in worker_counts if workers <= max_workers],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=hashing.BCRYPT_ROUNDS)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds, args.logins, args.max_workers))
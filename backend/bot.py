@@ -1,12 +1,21 @@
 """
-RAG-based FAQ Bot using FAISS and sentence-transformers
+RAG-based FAQ Bot using FAISS and sentence-transformers, with a BM25 fallback
 """
+import asyncio
+import hashlib
 import json
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 import numpy as np
 
+import lexical_index
+import vector_index
+
 try:
     import faiss
     from sentence_transformers import SentenceTransformer
@@ -14,6 +23,27 @@ try:
 except ImportError:
     FAISS_AVAILABLE = False
 
+# Concurrent questions are encoded together: at most BOT_BATCH_SIZE per model call,
+# waiting up to BOT_BATCH_WAIT_MS for a batch to fill
+BOT_BATCH_SIZE = int(os.getenv("BOT_BATCH_SIZE", "32"))
+BOT_BATCH_WAIT_MS = float(os.getenv("BOT_BATCH_WAIT_MS", "5"))
+BOT_CACHE_SIZE = int(os.getenv("BOT_CACHE_SIZE", "1024"))
+
+# Retrieval: candidates returned, and the minimum score to answer at all. Semantic scores are
+# cosine similarity (or 1 / (1 + distance) for the l2 metric); keyword scores are BM25.
+BOT_TOP_K = int(os.getenv("BOT_TOP_K", "3"))
+BOT_MIN_SIMILARITY = float(os.getenv("BOT_MIN_SIMILARITY", "0.45"))
+BOT_MIN_BM25 = float(os.getenv("BOT_MIN_BM25", "1.0"))
+# Share of the final semantic score that comes from keyword overlap (0 disables reranking),
+# and how many nearest neighbours are fetched for the reranker to reorder
+BOT_RERANK_WEIGHT = float(os.getenv("BOT_RERANK_WEIGHT", "0.2"))
+BOT_RERANK_DEPTH = int(os.getenv("BOT_RERANK_DEPTH", "10"))
+
+# "faiss" (semantic), "lexical" (BM25, no model) or "auto": faiss when installed, else lexical
+BOT_BACKEND = os.getenv("BOT_BACKEND", "auto")
+
+MANIFEST_VERSION = 2
+
 # Sample FAQs for the bot
 SAMPLE_FAQS = [
     {
@@ -50,67 +80,413 @@ SAMPLE_FAQS = [
     },
 ]
 
+def normalize_question(question: str) -> str:
+    """Cache key for a question: case, whitespace and trailing punctuation don't change the answer"""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+class LRUCache:
+    """Small least-recently-used cache with hit/miss counters"""
+
+    def __init__(self, max_size: int = BOT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class BatchEncoder:
+    """Coalesces concurrent encode requests into a single model call.
+
+    Requests are collected until `batch_size` texts are waiting or `wait_ms`
+    after the first one arrived and encoded together on a dedicated thread,
+    so inference never blocks the event loop. Callers asking for a text that
+    is already queued or being encoded share that result.
+    """
+
+    def __init__(self, encode_batch: Callable[[list[str]], np.ndarray],
+                 batch_size: int = BOT_BATCH_SIZE, wait_ms: float = BOT_BATCH_WAIT_MS):
+        self.encode_batch = encode_batch
+        self.batch_size = batch_size
+        self.wait = wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.batches = 0
+        self.encoded = 0
+
+    async def encode(self, text: str) -> np.ndarray:
+        if self._task is None:
+            # Started lazily so the encoder lives on whichever loop first uses it
+            self._queue = asyncio.Queue()
+            # One inference thread: the model already parallelises each call internally
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bot-encode")
+            self._task = asyncio.create_task(self._run())
+        future = self._in_flight.get(text)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[text] = future
+            self._queue.put_nowait((text, future))
+        return await asyncio.shield(future)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            # Every waiter is registered in _in_flight until its batch resolves it, which covers
+            # both the texts still queued and the batch being encoded when the task was cancelled
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            for future in self._in_flight.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("encoder stopped"))
+            self._in_flight.clear()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.encode_batch, texts
+            )
+        except Exception as e:
+            for text, future in batch:
+                self._in_flight.pop(text, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.encoded += len(texts)
+        for (text, future), embedding in zip(batch, embeddings):
+            self._in_flight.pop(text, None)
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "encoded": self.encoded}
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """A retrieved FAQ; higher scores are better"""
+    id: int
+    question: str
+    answer: str
+    score: float  # Final ranking score
+    similarity: Optional[float]  # Semantic similarity; None for the keyword backend
+    lexical: float  # BM25 score of the FAQ question against the query
+
+
+def faq_hash(faqs: list[dict]) -> str:
+    """Fingerprint of the FAQ set, stored in the manifest to detect stale embeddings"""
+    canonical = json.dumps(faqs, sort_keys=True, ensure_ascii=False).encode()
+    return hashlib.sha256(canonical).hexdigest()
+
+
 class RAGBot:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2",
+                 index_type: str = vector_index.BOT_INDEX_TYPE, metric: str = vector_index.BOT_METRIC):
         self.model_name = model_name
-        self.model = None
+        self.index_type = index_type
+        self.built_index_type = None  # May fall back to "flat" when there is too little data to train on
+        self.metric = metric
+        self.backend = "faiss" if FAISS_AVAILABLE and BOT_BACKEND != "lexical" else "lexical"
+        self.lexical: Optional[lexical_index.LexicalIndex] = None
+        self._model = None
+        self._model_failed = False
+        self._model_lock = threading.Lock()
         self.index = None
+        # FAQ ids are list positions; removed entries stay behind as None so ids never shift
         self.faqs = []
+        self._removed = 0
         self.embeddings = None
-        
-        if FAISS_AVAILABLE:
-            try:
-                self.model = SentenceTransformer(model_name)
-            except Exception as e:
-                print(f"Warning: Could not load sentence transformer: {e}")
+        # Embeddings depend only on the model; results also on the index, so they reset on (re)load
+        self.embedding_cache = LRUCache()
+        self.result_cache = LRUCache()
+        self.encoder = BatchEncoder(self._encode_batch)
+
+    @property
+    def model(self):
+        """The SentenceTransformer, loaded on first use so workers start without paying for it"""
+        if self._model is None and FAISS_AVAILABLE and not self._model_failed:
+            with self._model_lock:
+                if self._model is None and not self._model_failed:
+                    try:
+                        self._model = SentenceTransformer(self.model_name)
+                    except Exception as e:
+                        self._model_failed = True
+                        print(f"Warning: Could not load sentence transformer: {e}")
+                        self._fall_back_to_lexical()
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    @property
+    def model_loaded(self) -> bool:
+        """The model is in memory, so using it costs no load"""
+        return self._model is not None
+
+    @property
+    def ready(self) -> bool:
+        """An index and FAQs are loaded; the model itself may still be loaded lazily"""
+        if self.lexical is None or not self.faqs:
+            return False
+        # A model that fails to load switches the bot to "lexical", so no check for it here
+        return self.backend == "lexical" or self.index is not None
+
+    def _fall_back_to_lexical(self):
+        """Answer from the BM25 index, which is fitted alongside every vector index"""
+        if self.backend == "lexical":
+            return
+        print("Warning: Falling back to keyword (BM25) retrieval for the bot")
+        self.backend = "lexical"
+        self.result_cache.clear()
+
+    def _fit_lexical(self):
+        # Kept for both backends: it is the whole index for "lexical" and the reranker for "faiss"
+        live = [i for i, faq in enumerate(self.faqs) if faq is not None]
+        self.lexical = lexical_index.LexicalIndex().fit([self.faqs[i]["question"] for i in live], live)
+        self.result_cache.clear()
 
     def train_from_faqs(self, faqs: list[dict]):
         """Train the bot from a list of FAQ dictionaries"""
-        if not FAISS_AVAILABLE or not self.model:
-            return False
+        if self.backend == "faiss" and self.model is None:
+            self._fall_back_to_lexical()
+        if self.backend == "lexical":
+            self.faqs = list(faqs)
+            self._removed = 0
+            self._fit_lexical()
+            return True
         
         try:
-            self.faqs = faqs
+            self.faqs = list(faqs)
+            self._removed = 0
             questions = [faq["question"] for faq in faqs]
             
             # Generate embeddings for all questions
-            self.embeddings = self.model.encode(questions)
+            self.embeddings = vector_index.prepare(self.model.encode(questions), self.metric)
             
             # Create FAISS index
-            dimension = self.embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dimension)
-            self.index.add(self.embeddings.astype('float32'))
+            self.index, self.built_index_type = vector_index.build_index(
+                self.embeddings, np.arange(len(self.faqs)), self.index_type, self.metric
+            )
+            self._fit_lexical()
             
             return True
         except Exception as e:
             print(f"Error training bot: {e}")
             return False
 
-    def ask(self, question: str, top_k: int = 1) -> Optional[str]:
-        """Ask the bot a question and get the most relevant answer"""
-        if not self.model or not self.index or not self.faqs:
-            return None
+    def add_faqs(self, faqs: list[dict]) -> list[int]:
+        """Encode and index new FAQs without retraining; returns their ids"""
+        if not self.faqs:
+            return list(range(len(faqs))) if self.train_from_faqs(faqs) else []
+        if self.backend == "lexical":
+            ids = list(range(len(self.faqs), len(self.faqs) + len(faqs)))
+            self.faqs.extend(faqs)
+            self._fit_lexical()  # BM25 statistics are corpus-wide; refitting takes milliseconds
+            return ids
+        embeddings = vector_index.prepare(self.model.encode([faq["question"] for faq in faqs]), self.metric)
+        ids = np.arange(len(self.faqs), len(self.faqs) + len(faqs))
+        self.index.add_with_ids(embeddings, ids)
+        self.embeddings = np.vstack([self.embeddings, embeddings])
+        self.faqs.extend(faqs)
+        self._fit_lexical()
+        return ids.tolist()
+
+    def remove_faqs(self, ids: list[int]) -> int:
+        """Remove FAQs by id; returns how many were removed"""
+        ids = [i for i in ids if 0 <= i < len(self.faqs) and self.faqs[i] is not None]
+        if not ids:
+            return 0
+        if self.backend == "faiss" and vector_index.supports_remove(self.built_index_type):
+            self.index.remove_ids(np.array(ids, dtype='int64'))
+        for i in ids:
+            self.faqs[i] = None
+        self._removed += len(ids)
+        self._fit_lexical()
+        return len(ids)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Unit-length embeddings of arbitrary texts (blocking), for other cosine indexes to reuse the model"""
+        if self.model is None:
+            raise RuntimeError("Sentence transformer is not available")
+        return vector_index.normalize(self.model.encode(texts, batch_size=len(texts)))
+
+    def _encode_batch(self, questions: list[str]) -> np.ndarray:
+        if self.model is None:
+            raise RuntimeError("Sentence transformer is not available")
+        return vector_index.prepare(self.model.encode(questions, batch_size=len(questions)), self.metric)
+
+    def _candidates(self, ids: np.ndarray, score: np.ndarray, similarity, lexical: np.ndarray) -> list[Candidate]:
+        return [
+            Candidate(
+                id=int(idx),
+                question=self.faqs[idx]["question"],
+                answer=self.faqs[idx]["answer"],
+                score=float(score[i]),
+                similarity=None if similarity is None else float(similarity[i]),
+                lexical=float(lexical[i]),
+            )
+            for i, idx in enumerate(ids)
+        ]
+
+    def _rank(self, question: str, question_embedding: np.ndarray, top_k: int,
+              min_score: float, rerank_weight: float) -> list[Candidate]:
+        """Nearest neighbours -> cutoff -> lexical rerank, all on arrays of the k hits"""
+        depth = max(top_k, BOT_RERANK_DEPTH) if rerank_weight else top_k
+        if not vector_index.supports_remove(self.built_index_type):
+            depth += self._removed  # Removed entries may still be in the index
+        distances, indices = self.index.search(question_embedding.reshape(1, -1), min(depth, len(self.faqs)))
+        ids, distances = indices[0], distances[0]
+        
+        similarity = distances if self.metric == "cosine" else 1.0 / (1.0 + distances)
+        # -1 marks an empty result slot
+        live = np.array([0 <= idx < len(self.faqs) and self.faqs[idx] is not None for idx in ids], dtype=bool)
+        keep = live & (similarity >= min_score)
+        ids, similarity = ids[keep], similarity[keep]
+        
+        lexical = self.lexical.scores_for(question, ids)
+        score = similarity
+        if rerank_weight and len(ids) and lexical.max() > 0:
+            score = (1 - rerank_weight) * similarity + rerank_weight * lexical / lexical.max()
+        order = np.argsort(-score, kind="stable")[:top_k]
+        return self._candidates(ids[order], score[order], similarity[order], lexical[order])
+
+    def _rank_lexical(self, question: str, top_k: int, min_score: float) -> list[Candidate]:
+        scores, ids = self.lexical.search(question, top_k)
+        keep = scores >= min_score
+        return self._candidates(ids[keep], scores[keep], None, scores[keep])
+
+    def _min_score(self, min_score: Optional[float]) -> float:
+        if min_score is not None:
+            return min_score
+        return BOT_MIN_BM25 if self.backend == "lexical" else BOT_MIN_SIMILARITY
+
+    def retrieve(self, question: str, top_k: int = BOT_TOP_K, min_score: Optional[float] = None,
+                 rerank_weight: float = BOT_RERANK_WEIGHT) -> list[Candidate]:
+        """Scored top-k FAQs for a question, best first (blocking).
+
+        Hits scoring below `min_score` (default: BOT_MIN_SIMILARITY or BOT_MIN_BM25)
+        are dropped, so an empty list means the bot should decline to answer.
+        """
+        if not self.ready:
+            return []
         
+        requested_min_score = min_score
         try:
-            # Encode the question
-            question_embedding = self.model.encode([question])
-            
-            # Search in FAISS
-            distances, indices = self.index.search(question_embedding.astype('float32'), top_k)
-            
-            # Get the most relevant FAQ
-            if len(indices) > 0 and len(indices[0]) > 0:
-                best_idx = indices[0][0]
-                if 0 <= best_idx < len(self.faqs):
-                    return self.faqs[best_idx]["answer"]
-            
-            return None
+            key = normalize_question(question)
+            min_score = self._min_score(min_score)
+            cache_key = (key, top_k, min_score, rerank_weight)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return list(cached)
+            if self.backend == "lexical":
+                candidates = self._rank_lexical(key, top_k, min_score)
+            else:
+                question_embedding = self.embedding_cache.get(key)
+                if question_embedding is None:
+                    question_embedding = self._encode_batch([key])[0]
+                    self.embedding_cache.put(key, question_embedding)
+                candidates = self._rank(key, question_embedding, top_k, min_score, rerank_weight)
+            self.result_cache.put(cache_key, tuple(candidates))
+            return candidates
         except Exception as e:
+            if self.backend == "lexical" and self.lexical is not None:
+                # The model failed to load while encoding this question
+                return self._rank_lexical(key, top_k, self._min_score(requested_min_score))
             print(f"Error asking bot: {e}")
-            return None
+            return []
+
+    async def retrieve_async(self, question: str, top_k: int = BOT_TOP_K, min_score: Optional[float] = None,
+                             rerank_weight: float = BOT_RERANK_WEIGHT) -> list[Candidate]:
+        """Like retrieve(), but concurrent callers share batched model calls and never block the loop"""
+        if not self.ready:
+            return []
+        
+        requested_min_score = min_score
+        try:
+            key = normalize_question(question)
+            min_score = self._min_score(min_score)
+            cache_key = (key, top_k, min_score, rerank_weight)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return list(cached)
+            if self.backend == "lexical":
+                # Sub-millisecond and CPU-light: no need to leave the event loop
+                candidates = self._rank_lexical(key, top_k, min_score)
+            else:
+                question_embedding = self.embedding_cache.get(key)
+                if question_embedding is None:
+                    question_embedding = await self.encoder.encode(key)
+                    self.embedding_cache.put(key, question_embedding)
+                candidates = self._rank(key, question_embedding, top_k, min_score, rerank_weight)
+            self.result_cache.put(cache_key, tuple(candidates))
+            return candidates
+        except Exception as e:
+            if self.backend == "lexical" and self.lexical is not None:
+                # The model failed to load while encoding this question
+                return self._rank_lexical(key, top_k, self._min_score(requested_min_score))
+            print(f"Error asking bot: {e}")
+            return []
+
+    def ask(self, question: str, top_k: int = 1) -> Optional[str]:
+        """Ask the bot a question and get the most relevant answer, or None if nothing is relevant enough"""
+        candidates = self.retrieve(question, top_k)
+        return candidates[0].answer if candidates else None
+
+    async def ask_async(self, question: str, top_k: int = 1) -> Optional[str]:
+        candidates = await self.retrieve_async(question, top_k)
+        return candidates[0].answer if candidates else None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "encoder": self.encoder.stats(),
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+        }
 
     def save(self, path: str):
-        """Save the bot index and FAQs to disk"""
+        """Save the bot index, FAQs, embeddings and their manifest to disk"""
         try:
             os.makedirs(path, exist_ok=True)
             
@@ -122,32 +498,97 @@ class RAGBot:
             with open(os.path.join(path, "faqs.json"), "w") as f:
                 json.dump(self.faqs, f, indent=2)
             
+            # Save embeddings as a raw .npy so load() can memory-map them
+            if self.embeddings is not None:
+                np.save(os.path.join(path, "embeddings.npy"), np.asarray(self.embeddings, dtype='float32'))
+            
+            if self.embeddings is None:
+                return True  # Keyword-only bot: the FAQs are all there is to persist
+            
+            # The manifest is written last: its presence means the other files are complete
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "model_name": self.model_name,
+                "index_type": self.index_type,
+                "built_index_type": self.built_index_type,
+                "metric": self.metric,
+                "dimension": int(self.embeddings.shape[1]),
+                "count": len(self.faqs),
+                "faq_hash": faq_hash(self.faqs),
+            }
+            manifest_path = os.path.join(path, "manifest.json")
+            with open(manifest_path + ".tmp", "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            
             return True
         except Exception as e:
             print(f"Error saving bot: {e}")
             return False
 
-    def load(self, path: str):
-        """Load bot index and FAQs from disk"""
-        if not FAISS_AVAILABLE:
-            return False
+    def load(self, path: str, expected_faq_hash: Optional[str] = None):
+        """Load bot index, FAQs and embeddings from disk without running the model.
+
+        Returns False (so the caller retrains) when the manifest is missing or
+        does not match the model, the FAQs or the stored embeddings, or when
+        the saved FAQs are not the ones `expected_faq_hash` fingerprints. The
+        keyword backend only needs the FAQs and rebuilds its index from them.
+        """
+        if self.backend == "lexical":
+            faqs_path = os.path.join(path, "faqs.json")
+            if not os.path.exists(faqs_path):
+                return False
+            with open(faqs_path, "r") as f:
+                faqs = json.load(f)
+            if expected_faq_hash is not None and faq_hash(faqs) != expected_faq_hash:
+                return False
+            self.faqs = faqs
+            self._removed = sum(faq is None for faq in self.faqs)
+            self._fit_lexical()
+            return True
         
         try:
-            # Load index
-            index_path = os.path.join(path, "index.faiss")
-            if os.path.exists(index_path):
-                self.index = faiss.read_index(index_path)
+            manifest_path = os.path.join(path, "manifest.json")
+            if not os.path.exists(manifest_path):
+                return False
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            if (manifest.get("version") != MANIFEST_VERSION or manifest.get("model_name") != self.model_name
+                    or manifest.get("index_type") != self.index_type or manifest.get("metric") != self.metric):
+                return False
             
             # Load FAQs
-            faqs_path = os.path.join(path, "faqs.json")
-            if os.path.exists(faqs_path):
-                with open(faqs_path, "r") as f:
-                    self.faqs = json.load(f)
+            with open(os.path.join(path, "faqs.json"), "r") as f:
+                faqs = json.load(f)
+            if faq_hash(faqs) != manifest.get("faq_hash"):
+                return False
+            if expected_faq_hash is not None and manifest["faq_hash"] != expected_faq_hash:
+                return False  # The FAQ set changed since the save: its embeddings are stale
             
-            # Re-generate embeddings for reference
-            if self.faqs and self.model:
-                questions = [faq["question"] for faq in self.faqs]
-                self.embeddings = self.model.encode(questions)
+            # Memory-map the embeddings: pages are read on demand and shared between workers
+            embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+            if embeddings.shape != (len(faqs), manifest.get("dimension")):
+                return False
+            
+            # Load index, or rebuild it from the stored embeddings of the live FAQs
+            index_path = os.path.join(path, "index.faiss")
+            if os.path.exists(index_path):
+                index = faiss.read_index(index_path)
+                built_index_type = manifest.get("built_index_type")
+            else:
+                live = np.array([i for i, faq in enumerate(faqs) if faq is not None], dtype='int64')
+                index, built_index_type = vector_index.build_index(
+                    np.ascontiguousarray(embeddings[live]), live, self.index_type, self.metric
+                )
+            if index.ntotal > len(faqs) or index.d != embeddings.shape[1]:
+                return False
+            
+            self.faqs = faqs
+            self._removed = sum(faq is None for faq in faqs)
+            self.embeddings = embeddings
+            self.index = index
+            self.built_index_type = built_index_type
+            self._fit_lexical()
             
             return True
         except Exception as e:
@@ -172,7 +613,8 @@ def initialize_bot():
     # Try to load from disk first
     bot_path = Path("bot_data")
     if bot_path.exists():
-        if bot.load(str(bot_path)):
+        # Retrain when SAMPLE_FAQS was edited since bot_data was saved
+        if bot.load(str(bot_path), expected_faq_hash=faq_hash(SAMPLE_FAQS)):
             print("Bot loaded from disk")
             return
     
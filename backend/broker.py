@@ -0,0 +1,204 @@
+"""
+Pub/sub brokers that fan channel events out to every worker process
+"""
+import asyncio
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+# Called with (topic, data) for every event published by any worker, this one included
+EventHandler = Callable[[str, bytes], Awaitable[None]]
+
+
+class Broker:
+    """Base broker: workers publish to topics and every worker's handler receives them"""
+
+    def __init__(self):
+        self._handler: Optional[EventHandler] = None
+
+    def subscribe(self, handler: EventHandler):
+        self._handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, topic: str, data: bytes):
+        raise NotImplementedError
+
+    async def _dispatch(self, topic: str, data: bytes):
+        if self._handler is None:
+            return
+        try:
+            await self._handler(topic, data)
+        except Exception as e:
+            print(f"Broker handler error on {topic}: {e}")
+
+
+class MemoryBroker(Broker):
+    """Single-process broker: publishing hands the event straight to the local handler"""
+
+    async def publish(self, topic: str, data: bytes):
+        await self._dispatch(topic, data)
+
+
+class PostgresBroker(Broker):
+    """Broker built on Postgres LISTEN/NOTIFY, shared by every worker on the database"""
+
+    NOTIFY_CHANNEL = "discord_events"
+    # NOTIFY payloads are capped at 8000 bytes; larger envelopes are sent as chunks of
+    # at most this many bytes, leaving room for the "<event id>:<index>:<total>:" header
+    CHUNK_SIZE = 7000
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        if not PSYCOPG2_AVAILABLE:
+            raise RuntimeError("psycopg2 is required for the Postgres broker")
+        self.dsn = dsn
+        self._listen_conn = None
+        self._listen_fd: Optional[int] = None
+        self._publish_conn = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._publish_lock = asyncio.Lock()
+        self._partial: dict[str, list[str]] = {}
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        await self._listen()
+        self._publish_conn = await asyncio.to_thread(self._connect)
+        self._pump_task = asyncio.create_task(self._pump())
+
+    async def stop(self):
+        for task in (self._pump_task, self._reconnect_task):
+            if task is not None:
+                task.cancel()
+        self._pump_task = self._reconnect_task = None
+        self._close_listener()
+        if self._publish_conn is not None:
+            self._publish_conn.close()
+            self._publish_conn = None
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    async def _listen(self):
+        conn = await asyncio.to_thread(self._connect)
+        conn.cursor().execute(f"LISTEN {self.NOTIFY_CHANNEL}")
+        self._listen_conn = conn
+        # The listening socket is watched by the event loop, so no thread sits in poll()
+        self._listen_fd = conn.fileno()
+        self._loop.add_reader(self._listen_fd, self._on_readable)
+
+    def _close_listener(self):
+        if self._listen_fd is not None:
+            self._loop.remove_reader(self._listen_fd)
+            self._listen_fd = None
+        if self._listen_conn is not None:
+            try:
+                self._listen_conn.close()
+            except Exception:
+                pass
+            self._listen_conn = None
+        # Chunks of events that were cut off by the disconnect can never complete
+        self._partial.clear()
+
+    async def _reconnect(self):
+        """Replace a dead listening connection, retrying until the database is back"""
+        while True:
+            await asyncio.sleep(self.RECONNECT_DELAY)
+            try:
+                await self._listen()
+            except Exception as e:
+                print(f"Broker reconnect failed: {e}")
+                continue
+            print("Broker reconnected; events published while disconnected were missed")
+            self._reconnect_task = None
+            return
+
+    @classmethod
+    def _split(cls, envelope: bytes) -> list[str]:
+        """Cut an envelope into chunks of at most CHUNK_SIZE bytes, never inside a UTF-8 character"""
+        chunks, start = [], 0
+        while start < len(envelope):
+            end = min(start + cls.CHUNK_SIZE, len(envelope))
+            # Back up past continuation bytes (0b10xxxxxx) so the cut lands on a character boundary
+            while end < len(envelope) and envelope[end] & 0xC0 == 0x80:
+                end -= 1
+            chunks.append(envelope[start:end].decode())
+            start = end
+        return chunks
+
+    async def publish(self, topic: str, data: bytes):
+        # Event bytes are UTF-8 JSON, so they travel as NOTIFY text unchanged
+        envelope = topic.encode() + b"\n" + data
+        event_id = uuid.uuid4().hex
+        chunks = self._split(envelope)
+        payloads = [f"{event_id}:{i}:{len(chunks)}:{chunk}" for i, chunk in enumerate(chunks)]
+        async with self._publish_lock:
+            if self._publish_conn is None or self._publish_conn.closed:
+                self._publish_conn = await asyncio.to_thread(self._connect)
+            await asyncio.to_thread(self._notify, payloads)
+
+    def _notify(self, payloads: list[str]):
+        # One transaction so the chunks of an event are delivered together and in order
+        with self._publish_conn.cursor() as cursor:
+            cursor.execute("BEGIN")
+            for payload in payloads:
+                cursor.execute("SELECT pg_notify(%s, %s)", (self.NOTIFY_CHANNEL, payload))
+            cursor.execute("COMMIT")
+
+    def _on_readable(self):
+        try:
+            self._listen_conn.poll()
+        except Exception as e:
+            # The fd stays readable once the connection dies, so stop watching it and start over
+            print(f"Broker connection error: {e}")
+            self._close_listener()
+            if self._reconnect_task is None:
+                self._reconnect_task = asyncio.create_task(self._reconnect())
+            return
+        while self._listen_conn.notifies:
+            notify = self._listen_conn.notifies.pop(0)
+            event_id, index, total, chunk = notify.payload.split(":", 3)
+            parts = self._partial.setdefault(event_id, [])
+            parts.append(chunk)
+            if int(index) + 1 < int(total):
+                continue
+            del self._partial[event_id]
+            topic, _, data = "".join(parts).partition("\n")
+            self._inbox.put_nowait((topic, data.encode()))
+
+    async def _pump(self):
+        # Dispatch one event at a time so every worker delivers in NOTIFY order
+        while True:
+            topic, data = await self._inbox.get()
+            await self._dispatch(topic, data)
+
+
+def create_broker(url: Optional[str] = None) -> Broker:
+    """Create the broker selected by BROKER_URL (memory:// or postgresql://...)"""
+    url = url or os.getenv("BROKER_URL", "memory://")
+    parts = urlsplit(url)
+    scheme = parts.scheme.split("+")[0]
+    if scheme == "memory":
+        return MemoryBroker()
+    if scheme in ("postgres", "postgresql"):
+        # libpq does not understand SQLAlchemy-style "postgresql+driver" schemes
+        return PostgresBroker(urlunsplit(parts._replace(scheme="postgresql")))
+    raise ValueError(f"Unsupported BROKER_URL scheme: {parts.scheme}")
@@ -0,0 +1,207 @@
+"""
+WebSocket connections with per-socket outbound queues and slow-consumer handling
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Optional
+
+from fastapi import WebSocket, status
+
+import broker as broker_module
+from events import Event, pack_frame
+
+OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "256"))
+# What to do when a client cannot keep up: "drop", "coalesce" or "disconnect"
+SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "coalesce")
+
+# Events that are only useful while fresh and may be dropped or replaced by a newer one under pressure
+EPHEMERAL_EVENTS = {"typing_update"}
+
+
+class _Outbound:
+    __slots__ = ("event", "key")
+
+    def __init__(self, event: Event, key: Optional[tuple]):
+        self.event = event
+        self.key = key  # Set for ephemeral events only
+
+
+class Connection:
+    """A WebSocket with its own bounded outbound queue, drained by a dedicated writer task.
+
+    Enqueueing never awaits, so a slow client only ever delays itself. When the
+    queue is full the slow-consumer policy decides what gives: ephemeral events
+    are dropped ("drop"), replaced by the newest event with the same key
+    ("coalesce"), or the client is disconnected ("disconnect"). Chat messages
+    are never dropped silently: they evict a queued ephemeral event and, failing
+    that, the client is disconnected so it can reload history.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, binary: bool = False,
+                 max_queue: int = OUTBOUND_QUEUE_SIZE, policy: str = SLOW_CONSUMER_POLICY):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.binary = binary  # Client takes binary frames, so the encoded bytes go out as-is
+        self.max_queue = max_queue
+        self.policy = policy
+        self.closed = False
+        self.channels: set[int] = set()
+        self._queue: deque[_Outbound] = deque()
+        self._pending: dict[tuple, _Outbound] = {}  # Queued ephemeral events by key
+        self._ready = asyncio.Event()
+        self._overflowed = False
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    def enqueue(self, event: Event):
+        if self.closed or self._overflowed:
+            return
+        key = None
+        if event.type in EPHEMERAL_EVENTS:
+            key = (event.type, event.channel_id)
+            if self.policy == "coalesce" and key in self._pending:
+                self._pending[key].event = event
+                return
+
+        if len(self._queue) >= self.max_queue and not self._make_room(ephemeral=key is not None):
+            return
+
+        item = _Outbound(event, key)
+        self._queue.append(item)
+        if key is not None:
+            self._pending[key] = item
+        self._ready.set()
+
+    def send(self, payload: dict):
+        """Queue an event for this session only (acks, errors, handshake replies)"""
+        self.enqueue(Event(payload))
+
+    def _make_room(self, ephemeral: bool) -> bool:
+        if self.policy == "disconnect":
+            self._overflow()
+            return False
+        if ephemeral:
+            return False  # Drop the new ephemeral event
+        for item in self._queue:
+            if item.key is not None:
+                self._queue.remove(item)
+                self._pending.pop(item.key, None)
+                return True
+        self._overflow()
+        return False
+
+    def _overflow(self):
+        # The writer closes the socket; the endpoint's receive loop then cleans up
+        self._overflowed = True
+        self._queue.clear()
+        self._pending.clear()
+        self._ready.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                if self._overflowed:
+                    self.closed = True
+                    await self.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                    return
+                while self._queue:
+                    item = self._queue.popleft()
+                    if item.key is not None:
+                        self._pending.pop(item.key, None)
+                    if self.binary:
+                        await self.websocket.send_bytes(item.event.data)
+                    else:
+                        await self.websocket.send_text(item.event.text)
+                # An overflow during the sends above set _ready to get the socket closed; keep it set
+                if not self._overflowed:
+                    self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.closed = True
+
+
+class ConnectionManager:
+    """Subscription index for this worker: channel -> sessions and user -> sessions.
+
+    A session is one WebSocket. It may be subscribed to any number of
+    channels (the gateway) or to exactly one (the legacy per-channel
+    endpoint), and a user may hold several sessions at once, e.g. one per
+    browser tab.
+    """
+
+    def __init__(self, broker: broker_module.Broker):
+        self.broker = broker
+        self.channels: dict[int, set[Connection]] = {}
+        self.users: dict[int, set[Connection]] = {}
+
+    async def connect(self, websocket: WebSocket, user_id: int, binary: bool = False) -> Connection:
+        await websocket.accept()
+        connection = Connection(websocket, user_id, binary=binary)
+        connection.start()
+        self.users.setdefault(user_id, set()).add(connection)
+        return connection
+
+    def disconnect(self, connection: Connection) -> set[int]:
+        """Forget a session; returns the channels it was subscribed to"""
+        connection.stop()
+        channel_ids, connection.channels = connection.channels, set()
+        for channel_id in channel_ids:
+            self._discard(self.channels, channel_id, connection)
+        self._discard(self.users, connection.user_id, connection)
+        return channel_ids
+
+    def subscribe(self, connection: Connection, channel_id: int) -> bool:
+        """Add a channel to a session; False if it was already subscribed"""
+        if channel_id in connection.channels:
+            return False
+        connection.channels.add(channel_id)
+        self.channels.setdefault(channel_id, set()).add(connection)
+        return True
+
+    def unsubscribe(self, connection: Connection, channel_id: int) -> bool:
+        if channel_id not in connection.channels:
+            return False
+        connection.channels.discard(channel_id)
+        self._discard(self.channels, channel_id, connection)
+        return True
+
+    @staticmethod
+    def _discard(index: dict[int, set[Connection]], key: int, connection: Connection):
+        sessions = index.get(key)
+        if sessions is not None:
+            sessions.discard(connection)
+            if not sessions:
+                del index[key]
+
+    async def broadcast(self, channel_id: int, payload: dict, exclude_user: int | None = None):
+        """Publish to the channel on every worker; each one delivers to its own sockets"""
+        # Gateway sessions receive many channels on one socket, so every event names its channel
+        event = Event({**payload, "channel_id": channel_id})
+        await self.broker.publish(f"channel:{channel_id}", pack_frame(event, exclude_user))
+
+    async def deliver(self, channel_id: int, event: Event, exclude_user: int | None = None):
+        """Queue an event on every local session subscribed to the channel; writer tasks send in parallel"""
+        for connection in self.channels.get(channel_id, ()):
+            # Closed sessions are removed by their endpoint once its receive loop ends
+            if connection.closed or (exclude_user and connection.user_id == exclude_user):
+                continue
+            connection.enqueue(event)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": sum(len(sessions) for sessions in self.users.values()),
+            "users": len(self.users),
+            "channels": len(self.channels),
+            "subscriptions": sum(len(sessions) for sessions in self.channels.values()),
+        }
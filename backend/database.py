@@ -1,23 +1,141 @@
 import os
+import time
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text # <-- ADD 'text' HERE
+from sqlalchemy import create_engine, exc, text # <-- ADD 'text' HERE
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 load_dotenv()
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# --- Pool tuning (size the pool for the number of uvicorn workers sharing the database) ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds; -1 disables
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # asyncpg prepared statements
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))  # SQLAlchemy compiled SQL
+
+# Driver used by the async engine for each backend, and its blocking counterpart
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+SYNC_DRIVERS = {"postgresql": "psycopg2", "sqlite": "pysqlite"}
+
+
+def _with_driver(url: str, drivers: dict[str, str]) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in drivers:
+        return url
+    return parsed.set(drivername=f"{backend}+{drivers[backend]}").render_as_string(hide_password=False)
+
+
+# DATABASE_URL may name either driver (postgresql://, postgresql+asyncpg://,
+# sqlite:///, sqlite+aiosqlite:///); request handlers always get the async
+# driver for that database, while scripts and schema setup use the blocking one.
+ASYNC_DATABASE_URL = _with_driver(SQLALCHEMY_DATABASE_URL, ASYNC_DRIVERS)
+SYNC_DATABASE_URL = _with_driver(SQLALCHEMY_DATABASE_URL, SYNC_DRIVERS)
+
+engine = create_engine(SYNC_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class PoolMetrics:
+    """Counters for the request-path pool, published on /metrics"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that times how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+
+def _async_engine_options(url: str) -> dict:
+    options = {
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "query_cache_size": DB_QUERY_CACHE_SIZE,
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options  # In-memory SQLite keeps its single shared connection
+    options.update(
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    if parsed.get_backend_name() == "postgresql":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_async_engine_options(ASYNC_DATABASE_URL))
+# Objects stay readable after commit, since async sessions cannot lazy-load expired attributes
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-# --- This is a temporary block for testing the connection ---
-# We will remove this later, but it's useful for debugging now.
-try:
-    with engine.connect() as connection:
-        # Use the text() construct for the SQL command
-        connection.execute(text("SELECT 1"))
-    print("--- Database connection successful! ---")
-except Exception as e:
-    print(f"--- Database connection failed: {e} ---")
-# -----------------------------------------------------------
\ No newline at end of file
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_stats() -> dict:
+    """Current pool occupancy and checkout wait counters"""
+    pool = async_engine.sync_engine.pool
+    stats = {
+        "checkouts": pool_metrics.checkouts,
+        "timeouts": pool_metrics.timeouts,
+        "wait_ms_avg": round(pool_metrics.wait_seconds_total / pool_metrics.checkouts * 1000, 3) if pool_metrics.checkouts else 0.0,
+        "wait_ms_max": round(pool_metrics.wait_seconds_max * 1000, 3),
+    }
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        capacity = pool.size() + DB_MAX_OVERFLOW
+        stats.update(
+            pool_size=pool.size(),
+            max_overflow=DB_MAX_OVERFLOW,
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            saturation=round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+        )
+    return stats
+
+
+async def check_connection() -> bool:
+    """Lazy health check: run SELECT 1 on the request-path engine"""
+    try:
+        async with async_engine.connect() as connection:
+            # Use the text() construct for the SQL command
+            await connection.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        print(f"--- Database connection failed: {e} ---")
+        return False
@@ -0,0 +1,148 @@
+"""
+Cached server and channel lists for the sidebar, invalidated on every worker through the broker
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+import broker as broker_module
+import events
+import models
+import schemas
+
+DIRECTORY_CACHE_USERS = int(os.getenv("DIRECTORY_CACHE_USERS", "10000"))
+DIRECTORY_CACHE_SERVERS = int(os.getenv("DIRECTORY_CACHE_SERVERS", "10000"))
+
+
+class _VersionedCache:
+    """LRU map whose per-key version is bumped on invalidation, so stale loads can be discarded"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._versions: dict = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def version(self, key) -> int:
+        return self._versions.get(key, 0)
+
+    def put(self, key, value, version: int):
+        """Store a value loaded when the key was at `version`; dropped if it was invalidated since"""
+        if self._versions.get(key, 0) != version:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class ServerDirectory:
+    """Which servers each user belongs to (user -> server ids) and each server with its channels.
+
+    Both change rarely, so they are cached per worker and served without a
+    query once warm. Changes go through `server_changed()` and
+    `user_changed()`, which invalidate locally right away and publish the
+    invalidation to the other workers.
+    """
+
+    def __init__(self, broker: broker_module.Broker, max_users: int = DIRECTORY_CACHE_USERS,
+                 max_servers: int = DIRECTORY_CACHE_SERVERS):
+        self.broker = broker
+        self.memberships = _VersionedCache(max_users)
+        self.servers = _VersionedCache(max_servers)
+
+    async def servers_for(self, db: AsyncSession, user_id: int) -> list[dict]:
+        """Every server the user owns or belongs to, with its channels, ordered by id"""
+        server_ids = self.memberships.get(user_id)
+        if server_ids is None:
+            version = self.memberships.version(user_id)
+            server_ids = list((await db.execute(
+                select(models.Server.id)
+                .outerjoin(models.server_members)
+                .where((models.server_members.c.user_id == user_id) | (models.Server.owner_id == user_id))
+                .distinct()
+                .order_by(models.Server.id)
+            )).scalars().all())
+            self.memberships.put(user_id, server_ids, version)
+
+        servers = {server_id: self.servers.get(server_id) for server_id in server_ids}
+        missing = [server_id for server_id, server in servers.items() if server is None]
+        if missing:
+            servers.update(await self._load_servers(db, missing))
+        return [servers[server_id] for server_id in server_ids if servers.get(server_id) is not None]
+
+    async def server(self, db: AsyncSession, server_id: int) -> Optional[dict]:
+        """A server with its channels, or None if it doesn't exist"""
+        server = self.servers.get(server_id)
+        if server is None:
+            server = (await self._load_servers(db, [server_id])).get(server_id)
+        return server
+
+    async def _load_servers(self, db: AsyncSession, server_ids: list[int]) -> dict[int, dict]:
+        versions = {server_id: self.servers.version(server_id) for server_id in server_ids}
+        rows = (await db.execute(
+            select(models.Server).options(selectinload(models.Server.channels)).where(models.Server.id.in_(server_ids))
+        )).scalars().all()
+        loaded = {}
+        for row in rows:
+            server = schemas.ServerWithChannels.model_validate(row).model_dump(mode="json")
+            server["channels"].sort(key=lambda channel: channel["id"])
+            self.servers.put(row.id, server, versions[row.id])
+            loaded[row.id] = server
+        return loaded
+
+    # --- Invalidation ---
+    async def server_changed(self, server_id: int):
+        """The server or its channel list changed"""
+        self.servers.invalidate(server_id)
+        await self.broker.publish(f"server:{server_id}", b"")
+
+    async def user_changed(self, user_id: int):
+        """The user's set of servers changed"""
+        self.memberships.invalidate(user_id)
+        await self.broker.publish(f"user:{user_id}", b"")
+
+    def observe(self, kind: str, key: str):
+        """Apply an invalidation published by any worker"""
+        if kind == "server":
+            self.servers.invalidate(int(key))
+        elif kind == "user":
+            self.memberships.invalidate(int(key))
+
+    def stats(self) -> dict:
+        return {"memberships": self.memberships.stats(), "servers": self.servers.stats()}
+
+
+def conditional_json(request: Request, payload) -> Response:
+    """JSON response with a content ETag; 304 when the client already has this version"""
+    body = events.dumps(payload)
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    # "no-cache" lets browsers keep the list but revalidate it on every use
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
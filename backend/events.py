@@ -0,0 +1,109 @@
+"""
+Event encoding: serialize each WebSocket event once and share the bytes with every recipient
+"""
+import json
+from datetime import datetime
+from typing import Any, Optional
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if ORJSON_AVAILABLE:
+    def dumps(payload: Any) -> bytes:
+        return orjson.dumps(payload, default=_default)
+
+    loads = orjson.loads
+elif MSGSPEC_AVAILABLE:
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+    _decoder = msgspec.json.Decoder()
+
+    def dumps(payload: Any) -> bytes:
+        return _encoder.encode(payload)
+
+    def loads(data: bytes | str) -> Any:
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+else:
+    def dumps(payload: Any) -> bytes:
+        return json.dumps(payload, default=_default, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+
+class Event:
+    """An outgoing event, encoded once and shared by every recipient and worker.
+
+    Datetimes may be passed as-is; the encoder writes them as ISO 8601 strings.
+    `type` and `channel_id` are what routing needs; they are read from the
+    payload, or from the broker frame header so relaying never decodes.
+    """
+
+    __slots__ = ("_payload", "data", "_text", "_type", "channel_id")
+
+    def __init__(self, payload: Optional[dict] = None, data: Optional[bytes] = None,
+                 event_type: Optional[str] = None, channel_id: Optional[int] = None):
+        self._payload = payload
+        self.data = data if data is not None else dumps(payload)
+        self._text: Optional[str] = None
+        if payload is not None:
+            event_type = payload.get("type") if event_type is None else event_type
+            channel_id = payload.get("channel_id") if channel_id is None else channel_id
+        self._type = event_type
+        self.channel_id = channel_id
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Event":
+        return cls(data=data)
+
+    @property
+    def payload(self) -> dict:
+        # Events received from other workers are only decoded if something looks inside
+        if self._payload is None:
+            self._payload = loads(self.data)
+        return self._payload
+
+    @property
+    def type(self) -> Optional[str]:
+        if self._type is None:
+            self._type = self.payload.get("type") or ""
+        return self._type
+
+    @property
+    def text(self) -> str:
+        """The encoded event for clients that take text frames, decoded once"""
+        if self._text is None:
+            self._text = self.data.decode()
+        return self._text
+
+
+def pack_frame(event: Event, exclude_user: int | None = None) -> bytes:
+    """Prefix an encoded event with its routing header for the broker"""
+    # "<exclude user> <channel id> <type>\n": compact JSON never contains a raw newline,
+    # so the first one ends the header
+    header = b"%d %d %s\n" % (exclude_user or 0, event.channel_id or 0, event.type.encode())
+    return header + event.data
+
+
+def unpack_frame(frame: bytes) -> tuple[Event, int | None]:
+    header, _, data = frame.partition(b"\n")
+    exclude_user, channel_id, event_type = header.split(b" ", 2)
+    event = Event(data=data, event_type=event_type.decode(), channel_id=int(channel_id) or None)
+    return event, int(exclude_user) or None
@@ -0,0 +1,89 @@
+"""
+Password hashing on a dedicated, bounded worker pool
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# bcrypt releases the GIL while hashing, so threads give real parallelism without pickling
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Requests allowed to wait for a worker before logins are turned away with 503
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Re-hash a password at login when its stored cost differs from BCRYPT_ROUNDS
+PASSWORD_REHASH_ON_LOGIN = os.getenv("PASSWORD_REHASH_ON_LOGIN", "true").lower() in ("1", "true", "yes")
+
+
+class HashingBusy(Exception):
+    """The hashing pool and its queue are full"""
+
+
+def get_password_hash(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    pwd = password.encode('utf-8')[:72]
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(pwd, salt).decode()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(
+        plain_password.encode('utf-8')[:72],
+        hashed_password.encode('utf-8')
+    )
+
+
+def needs_rehash(hashed_password: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    """True when a stored hash ("$2b$<cost>$...") was made with a different work factor"""
+    try:
+        return int(hashed_password.split("$")[2]) != rounds
+    except (IndexError, ValueError):
+        return False
+
+
+class PasswordHasher:
+    """Runs bcrypt on its own thread pool so a login storm cannot starve other requests.
+
+    At most `workers` hashes run at once and `queue_limit` more may wait;
+    beyond that calls fail fast with HashingBusy instead of piling up.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS,
+                 queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT, rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def _run(self, func, *args):
+        if self.in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HashingBusy()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return needs_rehash(hashed_password, self.rounds)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "rounds": self.rounds,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,113 @@
+"""
+BM25 keyword retrieval in pure NumPy, used by the FAQ bot when FAISS or a transformer model is unavailable
+"""
+import re
+from collections import Counter
+from typing import Iterable, Optional
+
+import numpy as np
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a am an and are at be by can do does for from how i if in is it me my of on or so the this to what when where who why with you your".split()
+)
+
+
+def _stem(word: str) -> str:
+    # Just enough folding for FAQ matching: "files"/"file", "typing"/"type", "created"/"create"
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            word = word[:-len(suffix)]
+            break
+    return word[:-1] if word.endswith("e") and len(word) > 3 else word
+
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(word) for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Okapi BM25 over a fixed set of documents.
+
+    Postings are stored term-major with their BM25 weight precomputed, so a
+    query is a handful of array slices and one scatter-add, with no Python
+    loop over documents.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: dict[str, int] = {}
+        self.ids = np.zeros(0, dtype="int64")
+        self._offsets = np.zeros(1, dtype="int64")
+        self._documents = np.zeros(0, dtype="int64")
+        self._weights = np.zeros(0, dtype="float32")
+        self._row_of = np.zeros(0, dtype="int64")
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids)
+
+    def fit(self, texts: Iterable[str], ids: Optional[Iterable[int]] = None) -> "LexicalIndex":
+        """Index `texts`; results are reported as `ids` (default: their positions)"""
+        rows, columns, counts, lengths = [], [], [], []
+        vocabulary: dict[str, int] = {}
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                rows.append(row)
+                columns.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+
+        documents = len(lengths)
+        rows = np.array(rows, dtype="int64")
+        columns = np.array(columns, dtype="int64")
+        tf = np.array(counts, dtype="float32")
+        lengths = np.array(lengths, dtype="float32")
+        average_length = (float(lengths.mean()) if documents else 0.0) or 1.0
+
+        df = np.bincount(columns, minlength=len(vocabulary))
+        idf = np.log1p((documents - df + 0.5) / (df + 0.5)).astype("float32")
+        norm = self.k1 * (1 - self.b + self.b * lengths[rows] / average_length)
+        weights = idf[columns] * tf * (self.k1 + 1) / (tf + norm)
+
+        order = np.argsort(columns, kind="stable")
+        self.vocabulary = vocabulary
+        self._documents = rows[order]
+        self._weights = weights[order].astype("float32")
+        self._offsets = np.concatenate([[0], np.cumsum(df)]).astype("int64")
+        self.ids = np.arange(documents, dtype="int64") if ids is None else np.array(list(ids), dtype="int64")
+        self._row_of = np.full(int(self.ids.max()) + 1 if documents else 0, -1, dtype="int64")
+        self._row_of[self.ids] = np.arange(documents)
+        return self
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for `query` (0 where no term matches)"""
+        scores = np.zeros(self.ntotal, dtype="float32")
+        terms = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if terms:
+            postings = np.concatenate([np.arange(self._offsets[t], self._offsets[t + 1]) for t in terms])
+            np.add.at(scores, self._documents[postings], self._weights[postings])
+        return scores
+
+    def scores_for(self, query: str, ids: np.ndarray) -> np.ndarray:
+        """BM25 scores of the documents with the given ids (0 for unknown ids)"""
+        ids = np.asarray(ids, dtype="int64")
+        rows = np.full(len(ids), -1, dtype="int64")
+        known = (ids >= 0) & (ids < len(self._row_of))
+        rows[known] = self._row_of[ids[known]]
+        result = np.zeros(len(ids), dtype="float32")
+        if (rows >= 0).any():
+            result[rows >= 0] = self.scores(query)[rows[rows >= 0]]
+        return result
+
+    def search(self, query: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, ids), best first; documents sharing no term with the query are left out"""
+        scores = self.scores(query)
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], self.ids[top]
@@ -1,35 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Query, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload # <-- Import joinedload
-from jose import JWTError, jwt
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import os
-import bcrypt
-import json
-import shutil
-from pathlib import Path
 
 # Use absolute imports
 import models
 import schemas
 import database
+import auth
+import hashing
+import storage
+import attachments
+import previews
+import search
+import semantic_search
+import presence
+import replay
+import directory
+from auth import create_access_token
 import bot as bot_module
-
-database.Base.metadata.create_all(bind=database.engine)
+import broker as broker_module
+import events
+from message_writer import MessageWriter
+from message_cache import RecentMessages
+from connections import Connection, ConnectionManager
 
 app = FastAPI()
 
 # Create uploads directory if it doesn't exist
-UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR = storage.UPLOAD_DIR
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# Try to serve static files from uploads directory
-try:
-    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-except Exception:
-    pass  # Will handle if StaticFiles is unavailable
+# Uploaded files are served by the /uploads/{path} endpoint below (ranges, ETags, caching)
 
 # --- CORS MIDDLEWARE ---
 origins = ["http://localhost:5173"]
@@ -41,208 +48,311 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- Connection Manager for WebSockets ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[int, WebSocket] = {}  # Map user_id to websocket
-        self.typing_users: set[int] = set()
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        self.typing_users.discard(user_id)
-
-    async def broadcast(self, payload: dict, exclude_user: int | None = None):
-        message_str = json.dumps(payload)
-        disconnected_users = []
-        for user_id, connection in self.active_connections.items():
-            if exclude_user and user_id == exclude_user:
-                continue
-            try:
-                await connection.send_text(message_str)
-            except Exception:
-                disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            self.disconnect(user_id)
-
-    async def send_personal(self, user_id: int, payload: dict):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_text(json.dumps(payload))
-            except Exception:
-                self.disconnect(user_id)
-
-channel_managers: dict[int, ConnectionManager] = {}
+# --- Cross-worker fan-out ---
+broker = broker_module.create_broker()
+
+# --- Server and channel lists, cached per worker ---
+server_directory = directory.ServerDirectory(broker)
+
+# --- WebSocket sessions and their channel subscriptions ---
+manager = ConnectionManager(broker)
+
+async def handle_broker_event(topic: str, data: bytes):
+    """Deliver an event published by any worker to the sockets connected here"""
+    kind, _, key = topic.partition(":")
+    if kind in ("server", "user"):
+        server_directory.observe(kind, key)
+    elif kind == "attachment":
+        recent_messages.invalidate_file(key)
+    elif kind == "channel":
+        event, exclude_user = events.unpack_frame(data)
+        recent_messages.observe(int(key), event)
+        message_search.observe(int(key), event)
+        semantic_index.observe(int(key), event)
+        event = presence_tracker.apply(int(key), event)
+        if event is None:
+            return  # A presence update that changed nothing cluster-wide
+        event = replay_log.record(int(key), event)
+        await manager.deliver(int(key), event, exclude_user=exclude_user)
+
+# --- Channel event sequence numbers, replayed to resuming sessions ---
+replay_log = replay.ReplayLog()
+
+# --- Presence and typing indicators, published as periodic diffs ---
+presence_tracker = presence.PresenceTracker(manager.broadcast)
+
+# --- Batched message persistence ---
+message_writer = MessageWriter()
+
+# --- Newest messages of hot channels, served without a database round trip ---
+recent_messages = RecentMessages()
+
+# --- Full-text message search ---
+message_search = search.MessageSearch()
+
+# --- Semantic message search, embedded with the bot's model ---
+semantic_index = semantic_search.SemanticIndexer()
+
+# --- Attachment thumbnails, rendered off the event loop ---
+async def preview_ready(file_url: str):
+    """Cached history may show the file without its preview: tell every worker to reload it"""
+    await broker.publish(f"attachment:{file_url}", b"")
+
+preview_pipeline = previews.PreviewPipeline(on_ready=preview_ready)
+
+def create_schema(connection):
+    database.Base.metadata.create_all(bind=connection)
+    # create_all() skips indexes on tables that already exist, so add new ones explicitly
+    for index in models.Message.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+@app.on_event("startup")
+async def start_background_services():
+    async with database.async_engine.begin() as connection:
+        await connection.run_sync(create_schema)
+    await message_search.start()
+    broker.subscribe(handle_broker_event)
+    await broker.start()
+    await message_writer.start()
+    await presence_tracker.start()
+    # Loads the persisted index and embeddings; the model itself is loaded on the first question
+    try:
+        bot_module.initialize_bot()
+    except Exception as e:
+        print(f"Warning: Could not initialize bot: {e}")
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    await message_writer.stop()
+    await presence_tracker.stop()
+    await preview_pipeline.shutdown()
+    await message_search.stop()
+    await semantic_index.stop()
+    await bot_module.get_bot().encoder.stop()
+    await broker.stop()
+    await database.async_engine.dispose()
+    password_hasher.shutdown()
 
 # --- Security & Hashing ---
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+get_db = database.get_db
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-async def get_current_user_from_token(token: str, db: Session): # Removed Depends() for reuse in WebSocket
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None: return None
-    except JWTError:
-        return None
-    return db.query(models.User).filter(models.User.email == email).first()
-
-async def get_current_user_from_header(authorization: str = None, db: Session = Depends(get_db)) -> models.User:
-    """Extract token from Authorization header and return current user"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    token = authorization.split(" ")[1]
-    user = await get_current_user_from_token(token, db)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return user
+async def get_user_by_email(db: AsyncSession, email: str) -> models.User | None:
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
 
 # --- UPDATED Message History Endpoint ---
-@app.get("/channels/{channel_id}/messages", response_model=list[schemas.Message])
-def get_channel_messages(channel_id: int, db: Session = Depends(get_db)):
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 100
+
+@app.get("/channels/{channel_id}/messages", response_model=schemas.MessagePage)
+async def get_channel_messages(
+    channel_id: int,
+    before: int | None = None,
+    after: int | None = None,
+    around: int | None = None,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_MESSAGE_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get a newest-first page of channel history.
+
+    With no cursor the latest messages are returned. `before`/`after` page
+    older/newer than a message id and `around` centers the page on one.
+    Pass `next_cursor` back as `after` when paging forward, otherwise as
+    `before`; it is None once the end of the history is reached.
+    """
+    if sum(cursor is not None for cursor in (before, after, around)) > 1:
+        raise HTTPException(status_code=400, detail="Use only one of before, after or around")
+
     # FIXED: Use a JOIN to fetch users and messages in a single query
-    messages = (
-        db.query(models.Message)
+    query = (
+        select(models.Message)
         .options(joinedload(models.Message.owner)) # This performs the JOIN
-        .filter(models.Message.channel_id == channel_id)
-        .order_by(models.Message.id.asc())
-        .limit(50)
-        .all()
+        .options(joinedload(models.Message.attachment))
+        .where(models.Message.channel_id == channel_id)
     )
-    return messages
+
+    async def fetch(statement) -> list[models.Message]:
+        return list((await db.execute(statement)).scalars().all())
+
+    if after is not None:
+        newer = await fetch(query.where(models.Message.id > after).order_by(models.Message.id.asc()).limit(limit))
+        messages = newer[::-1]
+        next_cursor = messages[0].id if len(newer) == limit else None
+    elif around is not None:
+        older_limit = (limit + 1) // 2
+        older = await fetch(query.where(models.Message.id <= around).order_by(models.Message.id.desc()).limit(older_limit))
+        newer = await fetch(query.where(models.Message.id > around).order_by(models.Message.id.asc()).limit(limit - len(older)))
+        if len(older) == older_limit and len(older) + len(newer) < limit:
+            # Too few newer messages to fill their half: fill the page from the older side
+            older_limit = limit - len(newer)
+            older += await fetch(query.where(models.Message.id < older[-1].id).order_by(models.Message.id.desc()).limit(older_limit - len(older)))
+        messages = newer[::-1] + older
+        next_cursor = older[-1].id if len(older) == older_limit else None
+    elif before is not None:
+        messages = await fetch(query.where(models.Message.id < before).order_by(models.Message.id.desc()).limit(limit))
+        next_cursor = messages[-1].id if len(messages) == limit else None
+    else:
+        # Opening a channel: usually answered from the hot-channel buffer
+        messages = recent_messages.latest(channel_id, limit)
+        if messages is None:
+            async def fetch_latest(count: int) -> list[schemas.Message]:
+                rows = await fetch(query.order_by(models.Message.id.desc()).limit(count))
+                return [schemas.Message.model_validate(row) for row in rows]
+            messages = (await recent_messages.load(channel_id, fetch_latest))[:limit]
+        next_cursor = messages[-1].id if len(messages) == limit else None
+
+    return {"messages": messages, "next_cursor": next_cursor}
+
+# --- Message search ---
+def search_page(hits: list[tuple[models.Message, float]], next_cursor: int | None) -> schemas.SearchPage:
+    results = [
+        schemas.SearchHit.model_validate(message).model_copy(update={"score": score})
+        for message, score in hits
+    ]
+    return schemas.SearchPage(results=results, next_cursor=next_cursor)
+
+def validate_search_cursor(sort: str, cursor: int | None):
+    if sort not in search.SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(search.SORTS)}")
+    if sort == "relevance" and cursor is not None and not 0 <= cursor <= search.MAX_SEARCH_OFFSET:
+        raise HTTPException(status_code=400, detail="Refine the query to see more results")
+
+@app.get("/channels/{channel_id}/search", response_model=schemas.SearchPage)
+async def search_channel_messages(
+    channel_id: int,
+    q: str = Query(..., min_length=1),
+    sort: str = "relevance",
+    cursor: int | None = None,
+    limit: int = Query(search.SEARCH_PAGE_SIZE, ge=1, le=search.MAX_SEARCH_PAGE_SIZE),
+    user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Search a channel's messages; `sort` is "relevance" (default) or "recent".
+
+    Pass `next_cursor` back as `cursor` for the next page.
+    """
+    validate_search_cursor(sort, cursor)
+    hits, next_cursor = await message_search.search(db, q, [channel_id], sort, cursor, limit)
+    return search_page(hits, next_cursor)
+
+@app.get("/servers/{server_id}/search", response_model=schemas.SearchPage)
+async def search_server_messages(
+    server_id: int,
+    q: str = Query(..., min_length=1),
+    sort: str = "relevance",
+    cursor: int | None = None,
+    limit: int = Query(search.SEARCH_PAGE_SIZE, ge=1, le=search.MAX_SEARCH_PAGE_SIZE),
+    user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Search messages across every channel of a server"""
+    validate_search_cursor(sort, cursor)
+    channel_ids = (await db.execute(
+        select(models.Channel.id).where(models.Channel.server_id == server_id)
+    )).scalars().all()
+    if not channel_ids and not await db.get(models.Server, server_id):
+        raise HTTPException(status_code=404, detail="Server not found")
+    hits, next_cursor = await message_search.search(db, q, list(channel_ids), sort, cursor, limit)
+    return search_page(hits, next_cursor)
+
+@app.get("/servers/{server_id}/semantic-search", response_model=schemas.SearchPage)
+async def semantic_search_server_messages(
+    server_id: int,
+    q: str = Query(..., min_length=1),
+    channel_id: int | None = None,
+    limit: int = Query(search.SEARCH_PAGE_SIZE, ge=1, le=search.MAX_SEARCH_PAGE_SIZE),
+    user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Find messages by meaning rather than exact words, optionally within one channel.
+
+    Falls back to keyword search when no embedding model is available or
+    the semantic index is still being built.
+    """
+    if not await db.get(models.Server, server_id):
+        raise HTTPException(status_code=404, detail="Server not found")
+    hits = await semantic_index.search(db, server_id, q, channel_id, limit)
+    if hits is not None:
+        return search_page(hits, None)
+    channel_ids = [channel_id] if channel_id is not None else (await db.execute(
+        select(models.Channel.id).where(models.Channel.server_id == server_id)
+    )).scalars().all()
+    hits, _ = await message_search.search(db, q, list(channel_ids), "relevance", None, limit)
+    return search_page(hits, None)
+
+# --- Presence ---
+@app.get("/channels/{channel_id}/presence", response_model=schemas.PresenceSnapshot)
+async def get_channel_presence(channel_id: int, user: auth.UserSnapshot = Depends(auth.get_current_user)):
+    """Who is online and typing in a channel, for clients joining mid-conversation"""
+    return presence_tracker.snapshot(channel_id)
 
 # --- NEW: User Endpoints ---
 @app.get("/users/me", response_model=schemas.User)
-def get_current_user_info(authorization: str = None, db: Session = Depends(get_db)):
+async def get_current_user_info(user: auth.UserSnapshot = Depends(auth.get_current_user)):
     """Get current authenticated user information"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-        )
-    token = authorization.split(" ")[1]
-    user = None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email:
-            user = db.query(models.User).filter(models.User.email == email).first()
-    except JWTError:
-        pass
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-        )
     return user
 
 @app.get("/users/me/servers", response_model=list[schemas.Server])
-def get_user_servers(authorization: str = None, db: Session = Depends(get_db)):
+async def get_user_servers(request: Request, user: auth.UserSnapshot = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """Get all servers the current user belongs to"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    
-    token = authorization.split(" ")[1]
-    user = None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email:
-            user = db.query(models.User).filter(models.User.email == email).first()
-    except JWTError:
-        pass
-    
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
     # Return servers where user is a member or owner
-    servers = (
-        db.query(models.Server)
-        .outerjoin(models.server_members)
-        .filter((models.server_members.c.user_id == user.id) | (models.Server.owner_id == user.id))
-        .distinct()
-        .all()
-    )
-    return servers
+    servers = await server_directory.servers_for(db, user.id)
+    return directory.conditional_json(request, [
+        {field: value for field, value in server.items() if field != "channels"} for server in servers
+    ])
+
+@app.get("/users/me/sidebar", response_model=list[schemas.ServerWithChannels])
+async def get_user_sidebar(request: Request, user: auth.UserSnapshot = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """Every server the current user belongs to with its channels, in one request"""
+    return directory.conditional_json(request, await server_directory.servers_for(db, user.id))
 
 # --- NEW: Server Endpoints ---
 @app.post("/servers", response_model=schemas.Server, status_code=status.HTTP_201_CREATED)
-def create_server(server_data: schemas.ServerCreate, authorization: str = None, db: Session = Depends(get_db)):
+async def create_server(server_data: schemas.ServerCreate, user: auth.UserSnapshot = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """Create a new server (current user becomes owner)"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    
-    token = authorization.split(" ")[1]
-    user = None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email:
-            user = db.query(models.User).filter(models.User.email == email).first()
-    except JWTError:
-        pass
-    
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
     new_server = models.Server(name=server_data.name, owner_id=user.id)
     db.add(new_server)
-    db.commit()
-    db.refresh(new_server)
+    await db.commit()
+    await db.refresh(new_server)
+    await server_directory.user_changed(user.id)
     return new_server
 
+@app.post("/servers/{server_id}/join", status_code=status.HTTP_204_NO_CONTENT)
+async def join_server(server_id: int, user: auth.UserSnapshot = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """Become a member of a server"""
+    if not await db.get(models.Server, server_id):
+        raise HTTPException(status_code=404, detail="Server not found")
+    member = (models.server_members.c.user_id == user.id) & (models.server_members.c.server_id == server_id)
+    if not (await db.execute(select(models.server_members).where(member))).first():
+        await db.execute(models.server_members.insert().values(user_id=user.id, server_id=server_id))
+        await db.commit()
+        await server_directory.user_changed(user.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@app.post("/servers/{server_id}/leave", status_code=status.HTTP_204_NO_CONTENT)
+async def leave_server(server_id: int, user: auth.UserSnapshot = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """Stop being a member of a server (owners keep access to their own servers)"""
+    result = await db.execute(models.server_members.delete().where(
+        (models.server_members.c.user_id == user.id) & (models.server_members.c.server_id == server_id)
+    ))
+    await db.commit()
+    if result.rowcount:
+        await server_directory.user_changed(user.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
 @app.get("/servers/{server_id}/channels", response_model=list[schemas.Channel])
-def get_server_channels(server_id: int, db: Session = Depends(get_db)):
+async def get_server_channels(server_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Get all channels in a server"""
-    channels = db.query(models.Channel).filter(models.Channel.server_id == server_id).all()
-    if not channels and not db.query(models.Server).filter(models.Server.id == server_id).first():
+    server = await server_directory.server(db, server_id)
+    if server is None:
         raise HTTPException(status_code=404, detail="Server not found")
-    return channels
+    return directory.conditional_json(request, server["channels"])
 
 @app.post("/servers/{server_id}/channels", response_model=schemas.Channel, status_code=status.HTTP_201_CREATED)
-def create_channel(server_id: int, channel_data: schemas.ChannelCreate, authorization: str = None, db: Session = Depends(get_db)):
+async def create_channel(server_id: int, channel_data: schemas.ChannelCreate, user: auth.UserSnapshot = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
     """Create a new channel in a server"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    
-    token = authorization.split(" ")[1]
-    user = None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email:
-            user = db.query(models.User).filter(models.User.email == email).first()
-    except JWTError:
-        pass
-    
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
     # Check if server exists and user is owner
-    server = db.query(models.Server).filter(models.Server.id == server_id).first()
+    server = await db.get(models.Server, server_id)
     if not server:
         raise HTTPException(status_code=404, detail="Server not found")
     
@@ -251,212 +361,356 @@ def create_channel(server_id: int, channel_data: schemas.ChannelCreate, authoriz
     
     new_channel = models.Channel(name=channel_data.name, server_id=server_id)
     db.add(new_channel)
-    db.commit()
-    db.refresh(new_channel)
+    await db.commit()
+    await db.refresh(new_channel)
+    await server_directory.server_changed(server_id)
     return new_channel
 
 @app.post("/channels/{channel_id}/upload", status_code=status.HTTP_200_OK)
-async def upload_file(channel_id: int, file: UploadFile = File(...), authorization: str = None, db: Session = Depends(get_db)):
-    """Upload a file to a channel"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    
-    token = authorization.split(" ")[1]
-    user = None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email:
-            user = db.query(models.User).filter(models.User.email == email).first()
-    except JWTError:
-        pass
-    
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
+async def upload_file(channel_id: int, request: Request, user: auth.UserSnapshot = Depends(auth.get_current_user), db: AsyncSession = Depends(get_db)):
+    """Upload a file to a channel (multipart form field "file"), streamed into content-addressed storage"""
     # Verify channel exists
-    channel = db.query(models.Channel).filter(models.Channel.id == channel_id).first()
+    channel = await db.get(models.Channel, channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
-    
-    # Save file
-    file_path = UPLOAD_DIR / f"{channel_id}_{file.filename}"
+    # Don't hold a pooled connection open while the upload streams in
+    await db.close()
+
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"file_url": f"/uploads/{file_path.name}"}
+        blob = await storage.receive_upload(request)
+    except storage.UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is larger than {storage.MAX_UPLOAD_BYTES} bytes",
+        )
+    except storage.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+    # Thumbnail and metadata are produced in the background; messages pick them up once ready
+    preview_pipeline.submit(blob)
+    return {"file_url": blob.url, "filename": blob.filename, "size": blob.size, "sha256": blob.sha256}
+
+@app.api_route("/uploads/{path:path}", methods=["GET", "HEAD"])
+def serve_upload(path: str, request: Request):
+    """Serve an uploaded file with Range, ETag/conditional GET and cache headers"""
+    return attachments.serve(request, path)
+
+# --- WebSocket endpoints ---
+GATEWAY_MAX_SUBSCRIPTIONS = int(os.getenv("GATEWAY_MAX_SUBSCRIPTIONS", "200"))
+
+async def handle_client_event(connection: Connection, user: auth.UserSnapshot, channel_id: int, message_data: dict):
+    """Handle a "typing" or "message" frame a session sent to one of its channels"""
+    msg_type = message_data.get("type", "message")
+
+    if msg_type == "typing":
+        # Sent to the channel with the next coalesced typing_update
+        presence_tracker.typing(channel_id, user.id, user.username)
+
+    elif msg_type == "message":
+        content = message_data.get("content", "")
+        file_url = message_data.get("file_url")
+        presence_tracker.stopped_typing(channel_id, user.id)
+
+        # Save message to database through the batched writer
+        try:
+            saved = await message_writer.write(channel_id, user.id, content, file_url)
+        except Exception:
+            connection.send({
+                "type": "error",
+                "channel_id": channel_id,
+                "nonce": message_data.get("nonce"),
+                "content": "Message could not be saved.",
+            })
+            return
+
+        # Acknowledge to the sending session once the message is durable
+        connection.send({
+            "type": "ack",
+            "channel_id": channel_id,
+            "nonce": message_data.get("nonce"),
+            "id": saved["id"],
+            "timestamp": saved["timestamp"],
+        })
+
+        attachment = None
+        if file_url:
+            async with database.AsyncSessionLocal() as db:
+                preview = await previews.lookup(db, file_url)
+            if preview is not None:
+                attachment = schemas.AttachmentPreview.model_validate(preview).model_dump()
+
+        if file_url and (attachment is None or (attachment["thumbnail_url"] is None and previews.renders(attachment["mime_type"]))):
+            # The preview is not recorded or rendered yet: let the next read pick it up from the database
+            recent_messages.invalidate(channel_id)
+        else:
+            recent_messages.append(channel_id, schemas.Message(
+                id=saved["id"],
+                content=content,
+                owner=schemas.User(id=user.id, username=user.username, email=user.email),
+                timestamp=saved["timestamp"],
+                file_url=file_url,
+                attachment=attachment,
+            ))
+
+        # Broadcast message
+        message_obj = {
+            "type": "message",
+            "id": saved["id"],
+            "username": user.username,
+            "content": content,
+            "file_url": file_url,
+            "attachment": attachment,
+            "timestamp": saved["timestamp"]
+        }
+        await manager.broadcast(channel_id, message_obj)
+
+def join_channel(connection: Connection, user: auth.UserSnapshot, channel_id: int,
+                 epoch: str | None = None, seq: int | None = None) -> bool:
+    """Subscribe a session to a channel and tell it where the channel's event sequence stands.
+
+    A reconnecting session passes the epoch and last sequence number it saw
+    and is sent only the events it missed, or "resume_failed" when those
+    are gone or the epoch belongs to another worker. Sequence numbers are
+    per worker, so the client then pages in the missed messages by id with
+    the history endpoint's `after` cursor. Returns True if it resumed.
+    """
+    manager.subscribe(connection, channel_id)
+    presence_tracker.connected(channel_id, user.id, user.username)
+    position = {"channel_id": channel_id, "epoch": replay_log.epoch, "seq": replay_log.position(channel_id)}
+    if seq is None:
+        connection.send({"type": "session", **position})
+        return False
+    missed = replay_log.since(channel_id, epoch, seq)
+    if missed is None:
+        connection.send({"type": "resume_failed", **position})
+        return False
+    # Nothing can be delivered between subscribing and queueing the replay, so there are no gaps or repeats
+    for event in missed:
+        connection.enqueue(event)
+    connection.send({"type": "resumed", "replayed": len(missed), **position})
+    return True
+
+def close_session(connection: Connection, user: auth.UserSnapshot) -> set[int]:
+    channel_ids = manager.disconnect(connection)
+    for channel_id in channel_ids:
+        presence_tracker.disconnected(channel_id, user.id)
+    return channel_ids
 
-# --- UPDATED WebSocket Endpoint ---
 @app.websocket("/ws/{channel_id}")
-async def websocket_endpoint(websocket: WebSocket, channel_id: int, token: str = Query(...)):
+async def websocket_endpoint(websocket: WebSocket, channel_id: int, token: str = Query(...), binary: bool = False,
+                             epoch: str | None = None, seq: int | None = None):
+    """Chat in one channel. Reconnect with the `epoch` and last `seq` received to resume"""
     # Use a context manager for the database session
-    with database.SessionLocal() as db:
-        user = await get_current_user_from_token(token=token, db=db)
+    async with database.AsyncSessionLocal() as db:
+        user = await auth.authenticate(token, db)
     
     if not user:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
 
-    if channel_id not in channel_managers:
-        channel_managers[channel_id] = ConnectionManager()
-    manager = channel_managers[channel_id]
+    connection = await manager.connect(websocket, user.id, binary=binary)
+    resumed = join_channel(connection, user, channel_id, epoch, seq)
 
-    await manager.connect(websocket, user.id)
-
-    # Announce user joined
-    connect_message = {
-        "type": "user_joined",
-        "username": "System",
-        "content": f"{user.username} has joined the chat.",
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
-    await manager.broadcast(connect_message)
+    # Announce user joined, unless this is the same session picking up where it left off
+    if not resumed:
+        connect_message = {
+            "type": "user_joined",
+            "username": "System",
+            "content": f"{user.username} has joined the chat.",
+            "timestamp": datetime.now(timezone.utc)
+        }
+        await manager.broadcast(channel_id, connect_message)
 
     try:
         while True:
             data = await websocket.receive_text()
             
             try:
-                message_data = json.loads(data)
-            except json.JSONDecodeError:
+                message_data = events.loads(data)
+            except ValueError:
                 # If not JSON, treat as regular message
                 message_data = {"type": "message", "content": data}
-            
-            msg_type = message_data.get("type", "message")
-            
-            if msg_type == "typing":
-                # Broadcast typing indicator to other users
-                typing_message = {
-                    "type": "typing",
-                    "username": user.username,
-                    "timestamp": datetime.now(timezone.utc).isoformat()
-                }
-                await manager.broadcast(typing_message, exclude_user=user.id)
-                
-            elif msg_type == "message":
-                content = message_data.get("content", "")
-                file_url = message_data.get("file_url")
-                
-                # Save message to database
-                with database.SessionLocal() as db:
-                    new_message = models.Message(
-                        content=content, 
-                        channel_id=channel_id, 
-                        owner_id=user.id,
-                        file_url=file_url,
-                        timestamp=datetime.now(timezone.utc)
-                    )
-                    db.add(new_message)
-                    db.commit()
-                    db.refresh(new_message)
-
-                # Broadcast message
-                message_obj = {
-                    "type": "message",
-                    "id": new_message.id,
-                    "username": user.username,
-                    "content": content,
-                    "file_url": file_url,
-                    "timestamp": new_message.timestamp.isoformat() if new_message.timestamp else datetime.now(timezone.utc).isoformat()
-                }
-                await manager.broadcast(message_obj)
+
+            await handle_client_event(connection, user, channel_id, message_data)
             
     except WebSocketDisconnect:
-        manager.disconnect(user.id)
+        close_session(connection, user)
         disconnect_message = {
             "type": "user_left",
             "username": "System",
             "content": f"{user.username} has left the chat.",
-            "timestamp": datetime.now(timezone.utc).isoformat()
+            "timestamp": datetime.now(timezone.utc)
         }
-        await manager.broadcast(disconnect_message)
+        await manager.broadcast(channel_id, disconnect_message)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(user.id)
-
-# ... (rest of your hashing functions and HTTP endpoints are unchanged) ...
-def get_password_hash(password: str) -> str:
-    pwd = password.encode('utf-8')[:72]
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(pwd, salt).decode()
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        plain_password.encode('utf-8')[:72],
-        hashed_password.encode('utf-8')
+        close_session(connection, user)
+
+async def gateway_subscribe(connection: Connection, user: auth.UserSnapshot, channel_ids: list[int],
+                            epoch: str | None = None, seqs: dict[int, int] | None = None):
+    requested = [channel_id for channel_id in dict.fromkeys(channel_ids) if channel_id not in connection.channels]
+    if len(connection.channels) + len(requested) > GATEWAY_MAX_SUBSCRIPTIONS:
+        connection.send({"type": "error", "content": f"At most {GATEWAY_MAX_SUBSCRIPTIONS} channels per connection."})
+        return
+    async with database.AsyncSessionLocal() as db:
+        existing = set((await db.execute(
+            select(models.Channel.id).where(models.Channel.id.in_(requested))
+        )).scalars().all()) if requested else set()
+    subscribed = []
+    for channel_id in requested:
+        if channel_id in existing:
+            join_channel(connection, user, channel_id, epoch, (seqs or {}).get(channel_id))
+            subscribed.append(channel_id)
+    connection.send({"type": "subscribed", "channel_ids": subscribed})
+
+@app.websocket("/gateway")
+async def gateway_endpoint(websocket: WebSocket, token: str = Query(...), binary: bool = False):
+    """One socket per client for every channel it has open.
+
+    Clients send {"type": "subscribe" | "unsubscribe", "channel_ids": [...]}
+    to change subscriptions, and "message" / "typing" frames with the
+    "channel_id" they are for. Every event sent back names its "channel_id".
+    To resume after a reconnect, a subscribe frame also carries the "epoch"
+    and a "seq" map of channel id -> last sequence number received.
+    """
+    async with database.AsyncSessionLocal() as db:
+        user = await auth.authenticate(token, db)
+    if not user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    connection = await manager.connect(websocket, user.id, binary=binary)
+    connection.send({"type": "ready", "user_id": user.id})
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                message_data = events.loads(data)
+                msg_type = message_data.get("type")
+                channel_ids = [int(channel_id) for channel_id in message_data.get("channel_ids", ())]
+                seqs = {int(channel_id): int(seq) for channel_id, seq in (message_data.get("seq") or {}).items()}
+            except (ValueError, TypeError, AttributeError):
+                connection.send({"type": "error", "content": "Frames must be JSON objects."})
+                continue
+
+            if msg_type == "subscribe":
+                await gateway_subscribe(connection, user, channel_ids, message_data.get("epoch"), seqs)
+            elif msg_type == "unsubscribe":
+                for channel_id in channel_ids:
+                    if manager.unsubscribe(connection, channel_id):
+                        presence_tracker.disconnected(channel_id, user.id)
+                connection.send({"type": "unsubscribed", "channel_ids": channel_ids})
+            elif message_data.get("channel_id") in connection.channels:
+                await handle_client_event(connection, user, message_data["channel_id"], message_data)
+            else:
+                connection.send({
+                    "type": "error",
+                    "channel_id": message_data.get("channel_id"),
+                    "nonce": message_data.get("nonce"),
+                    "content": "Subscribe to the channel first.",
+                })
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Gateway error: {e}")
+    finally:
+        close_session(connection, user)
+
+# --- Password hashing on its own bounded pool ---
+password_hasher = hashing.PasswordHasher()
+
+@app.exception_handler(hashing.HashingBusy)
+async def hashing_busy_handler(request: Request, exc: hashing.HashingBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, retry shortly"},
+        headers={"Retry-After": "1"},
     )
 
-def create_access_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-    
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Discord Clone API"}
 
+@app.get("/health")
+async def health_check(response: Response):
+    """Liveness plus a lazy database probe"""
+    if not await database.check_connection():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "degraded", "database": "unavailable"}
+    return {"status": "ok", "database": "ok"}
+
+@app.get("/metrics")
+def get_metrics():
+    """Runtime counters for capacity planning"""
+    return {
+        "db_pool": database.pool_stats(),
+        "auth_cache": auth.auth_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "bot": bot_module.get_bot().stats(),
+        "recent_messages": recent_messages.stats(),
+        "connections": manager.stats(),
+        "directory": server_directory.stats(),
+        "presence": presence_tracker.stats(),
+        "replay": replay_log.stats(),
+        "search": message_search.stats(),
+        "semantic_search": semantic_index.stats(),
+    }
+
 @app.post("/register/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     new_user = models.User(
         username=user.username, email=user.email, hashed_password=hashed_password
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await get_user_by_email(db, form_data.username)
+    if not user or not await password_hasher.verify(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # Upgrade the stored hash when BCRYPT_ROUNDS has changed since it was made
+    if hashing.PASSWORD_REHASH_ON_LOGIN and password_hasher.needs_rehash(user.hashed_password):
+        user.hashed_password = await password_hasher.hash(form_data.password)
+        await db.commit()
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- Bot Endpoints ---
 @app.post("/ask-bot")
-def ask_bot_endpoint(question: dict, authorization: str = None, db: Session = Depends(get_db)):
+async def ask_bot_endpoint(question: dict, user: auth.UserSnapshot = Depends(auth.get_current_user)):
     """Ask the FAQ bot a question"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    
-    token = authorization.split(" ")[1]
-    user = None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email:
-            user = db.query(models.User).filter(models.User.email == email).first()
-    except JWTError:
-        pass
-    
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
     question_text = question.get("question", "")
     if not question_text:
         raise HTTPException(status_code=400, detail="Question is required")
     
     try:
         bot = bot_module.get_bot()
-        answer = bot.ask(question_text)
+        # Candidates below the relevance cutoff are already dropped, so an empty list means "decline"
+        candidates = await bot.retrieve_async(question_text)
         
-        if answer:
-            return {"answer": answer, "found": True}
+        if candidates:
+            best = candidates[0]
+            return {
+                "answer": best.answer,
+                "found": True,
+                "score": round(best.score, 4),
+                "matched_question": best.question,
+                "suggestions": [candidate.question for candidate in candidates[1:]],
+            }
         else:
-            return {"answer": "I don't have an answer to that question. Please try asking something else.", "found": False}
+            return {"answer": "I don't have an answer to that question. Please try asking something else.", "found": False, "suggestions": []}
     except Exception as e:
         print(f"Bot error: {e}")
         return {"answer": "Sorry, I encountered an error. Please try again.", "found": False}
@@ -472,12 +726,6 @@ def init_db(db: Session):
         db.add(default_channel)
         db.commit()
 
-# Initialize bot on startup
-try:
-    bot_module.initialize_bot()
-except Exception as e:
-    print(f"Warning: Could not initialize bot: {e}")
-
 # Run init_db only if this file is executed directly (for setup), not by uvicorn
 if __name__ == "__main__":
     with database.SessionLocal() as db:
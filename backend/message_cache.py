@@ -0,0 +1,120 @@
+"""
+In-memory cache of the newest messages in hot channels, so opening a channel skips the database
+"""
+import bisect
+import os
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+import events
+import schemas
+
+HOT_CHANNEL_MESSAGES = int(os.getenv("HOT_CHANNEL_MESSAGES", "100"))
+HOT_CHANNEL_COUNT = int(os.getenv("HOT_CHANNEL_COUNT", "1000"))
+
+
+class _Buffer:
+    __slots__ = ("messages", "complete")
+
+    def __init__(self, messages: list[schemas.Message], capacity: int, complete: bool):
+        self.messages: deque[schemas.Message] = deque(messages, maxlen=capacity)  # Oldest first
+        self.complete = complete  # True when the buffer holds the channel's entire history
+
+
+class RecentMessages:
+    """Per-channel ring buffers of the latest `capacity` messages, LRU-bounded to `max_channels`.
+
+    A buffer is filled from the database on the first read of a channel and
+    then kept current by `append()` on the worker that saved each message.
+    Other workers cannot rebuild the full message from a broker event, so
+    `observe()` drops their copy of the channel instead, and
+    `invalidate_file()` drops channels whose attachment previews finished
+    rendering after they were cached. Every append to an
+    uncached channel and every invalidation bumps the channel's generation,
+    which discards database reads that may have missed it.
+    """
+
+    def __init__(self, capacity: int = HOT_CHANNEL_MESSAGES, max_channels: int = HOT_CHANNEL_COUNT):
+        self.capacity = capacity
+        self.max_channels = max_channels
+        self._buffers: OrderedDict[int, _Buffer] = OrderedDict()
+        self._generations: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def latest(self, channel_id: int, limit: int) -> Optional[list[schemas.Message]]:
+        """The newest `limit` messages, newest first, or None when the cache can't answer"""
+        buffer = self._buffers.get(channel_id)
+        if buffer is None or limit > self.capacity or (len(buffer.messages) < limit and not buffer.complete):
+            self.misses += 1
+            return None
+        self._buffers.move_to_end(channel_id)
+        self.hits += 1
+        count = min(limit, len(buffer.messages))
+        return [buffer.messages[-i] for i in range(1, count + 1)]
+
+    async def load(self, channel_id: int,
+                   fetch: Callable[[int], Awaitable[list[schemas.Message]]]) -> list[schemas.Message]:
+        """Read the newest `capacity` messages (newest first) through `fetch` and cache them"""
+        generation = self._generations.get(channel_id, 0)
+        messages = await fetch(self.capacity)
+        if self._generations.get(channel_id, 0) == generation:
+            self._buffers[channel_id] = _Buffer(messages[::-1], self.capacity, len(messages) < self.capacity)
+            self._buffers.move_to_end(channel_id)
+            while len(self._buffers) > self.max_channels:
+                self._buffers.popitem(last=False)
+        return messages
+
+    def append(self, channel_id: int, message: schemas.Message):
+        """Add a message saved by this worker"""
+        buffer = self._buffers.get(channel_id)
+        if buffer is None:
+            self._bump(channel_id)
+            return
+        if buffer.messages and message.id <= buffer.messages[-1].id:
+            # Batched writes can resolve slightly out of order; keep the buffer sorted by id
+            ordered = list(buffer.messages)
+            ids = [m.id for m in ordered]
+            position = bisect.bisect_left(ids, message.id)
+            if position < len(ids) and ids[position] == message.id:
+                return  # A load() that ran after the commit already picked it up
+            ordered.insert(position, message)
+            buffer.messages = deque(ordered, maxlen=self.capacity)
+            if len(ordered) > self.capacity:
+                buffer.complete = False
+        else:
+            if len(buffer.messages) == self.capacity:
+                buffer.complete = False
+            buffer.messages.append(message)
+
+    def observe(self, channel_id: int, event: events.Event):
+        """Drop the channel when a message published elsewhere is missing from the buffer"""
+        buffer = self._buffers.get(channel_id)
+        if buffer is None or event.type != "message":
+            return
+        message_id = event.payload.get("id")
+        if not any(message.id == message_id for message in reversed(buffer.messages)):
+            self.invalidate(channel_id)
+
+    def invalidate_file(self, file_url: str):
+        """Drop every channel showing this file, whose cached preview metadata is now out of date"""
+        stale = [channel_id for channel_id, buffer in self._buffers.items()
+                 if any(message.file_url == file_url for message in buffer.messages)]
+        for channel_id in stale:
+            self.invalidate(channel_id)
+
+    def invalidate(self, channel_id: int):
+        self._buffers.pop(channel_id, None)
+        self._bump(channel_id)
+
+    def _bump(self, channel_id: int):
+        self._generations[channel_id] = self._generations.get(channel_id, 0) + 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "channels": len(self._buffers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,131 @@
+"""
+Write-behind pipeline that batches chat message inserts off the event loop
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import insert
+
+import database
+import models
+
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "100"))
+MESSAGE_BATCH_INTERVAL_MS = int(os.getenv("MESSAGE_BATCH_INTERVAL_MS", "10"))
+MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGE_QUEUE_SIZE", "10000"))
+
+# Queued by stop(): the writer flushes the batch it is building and exits
+_STOP = None
+
+
+class _PendingMessage:
+    __slots__ = ("values", "future")
+
+    def __init__(self, values: dict, future: asyncio.Future):
+        self.values = values
+        self.future = future
+
+
+class MessageWriter:
+    """Queues incoming chat messages and inserts them in batches.
+
+    A batch is flushed once it holds `batch_size` messages or `interval_ms`
+    after its first message arrived, whichever comes first, as one multi-row
+    INSERT ... RETURNING on the async engine. `write()` resolves once the batch
+    is committed, so callers only acknowledge messages that are durable.
+    """
+
+    def __init__(self, batch_size: int = MESSAGE_BATCH_SIZE,
+                 interval_ms: int = MESSAGE_BATCH_INTERVAL_MS,
+                 max_queue: int = MESSAGE_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self._queue: asyncio.Queue[Optional[_PendingMessage]] = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything queued so far, then fail any write that arrives after it"""
+        self._stopped = True
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+        error = RuntimeError("Message writer stopped")
+        while not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if pending is not _STOP and not pending.future.done():
+                pending.future.set_exception(error)
+
+    async def write(self, channel_id: int, owner_id: int, content: str,
+                    file_url: str | None = None) -> dict:
+        """Queue a message and wait until it is committed; returns its id and timestamp"""
+        if self._stopped:
+            raise RuntimeError("Message writer stopped")
+        future = asyncio.get_running_loop().create_future()
+        values = {
+            "content": content,
+            "channel_id": channel_id,
+            "owner_id": owner_id,
+            "file_url": file_url,
+            # Stamped on arrival so batching does not reorder timestamps
+            "timestamp": datetime.now(timezone.utc),
+        }
+        # Waits here when the queue is full, pushing back on the sending socket
+        await self._queue.put(_PendingMessage(values, future))
+        if self._stopped and self._task is None and not future.done():
+            # Queued after stop() drained the queue; nothing will flush it
+            future.set_exception(RuntimeError("Message writer stopped"))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if pending is _STOP:
+                    stopping = True
+                    break
+                batch.append(pending)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[_PendingMessage]):
+        try:
+            rows = await self._insert([pending.values for pending in batch])
+        except Exception as e:
+            print(f"Error writing message batch: {e}")
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        for pending, row in zip(batch, rows):
+            if not pending.future.done():
+                pending.future.set_result({"id": row.id, "timestamp": row.timestamp})
+
+    async def _insert(self, values: list[dict]):
+        async with database.AsyncSessionLocal() as db:
+            result = await db.execute(
+                insert(models.Message).returning(
+                    models.Message.id, models.Message.timestamp, sort_by_parameter_order=True
+                ),
+                values,
+            )
+            rows = result.all()
+            await db.commit()
+        return rows
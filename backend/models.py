@@ -1,8 +1,23 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime # <-- Added DateTime
+import os
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime, Index, literal_column # <-- Added DateTime
+from sqlalchemy.dialects.postgresql import REGCONFIG
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func # <-- Added this to use func.now()
 import database
 
+# Text search configuration for message search; baked into the Postgres expression index below,
+# so changing it needs that index recreated
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+
+
+def search_config():
+    return literal_column(f"'{SEARCH_LANGUAGE}'", type_=REGCONFIG)
+
+
+def content_tsvector(column):
+    """to_tsvector(<language>, column), written identically in the index and in queries so Postgres can match them"""
+    return func.to_tsvector(search_config(), column)
+
 # This is the "join" table that links Users and Servers
 server_members = Table(
     "server_members",
@@ -56,4 +71,35 @@ class Message(database.Base):
     file_url = Column(String, nullable=True)
 
     channel = relationship("Channel", back_populates="messages")
-    owner = relationship("User")
\ No newline at end of file
+    owner = relationship("User")
+    # Preview metadata for file_url, filled in by the preview pipeline after upload
+    attachment = relationship(
+        "Attachment",
+        primaryjoin="foreign(Message.file_url) == Attachment.url",
+        uselist=False,
+        viewonly=True,
+    )
+
+    # Keyset pagination walks (channel_id, id) in either direction, so history
+    # pages stay an index range scan no matter how deep the channel is.
+    __table_args__ = (
+        Index("ix_messages_channel_id_id", "channel_id", "id"),
+        # Full-text search. An expression index is kept up to date by Postgres on every insert,
+        # with no extra column to backfill; other databases use the in-process index in search.py.
+        Index("ix_messages_content_fts", content_tsvector(content), postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+
+
+class Attachment(database.Base):
+    """One row per stored blob: what clients need to render it without downloading it"""
+    __tablename__ = "attachments"
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, unique=True, index=True)  # Matches Message.file_url
+    sha256 = Column(String, index=True)
+    filename = Column(String)
+    mime_type = Column(String)
+    size = Column(Integer)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    thumbnail_url = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
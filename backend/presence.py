@@ -0,0 +1,274 @@
+"""
+Channel presence and typing state, published as coalesced, rate-limited diffs
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+
+from events import Event
+
+TYPING_TIMEOUT_MS = int(os.getenv("TYPING_TIMEOUT_MS", "5000"))
+TYPING_FLUSH_MS = int(os.getenv("TYPING_FLUSH_MS", "500"))
+TYPING_RATE_LIMIT_MS = int(os.getenv("TYPING_RATE_LIMIT_MS", "1000"))
+# How often each worker republishes its full online lists; workers silent for 3 intervals are forgotten
+PRESENCE_SYNC_MS = int(os.getenv("PRESENCE_SYNC_MS", "30000"))
+
+# Called with (channel_id, payload) to broadcast an update to every worker
+Publisher = Callable[[int, dict], Awaitable[None]]
+
+
+def _users(users: dict[int, str]) -> list[dict]:
+    return [{"id": user_id, "username": username} for user_id, username in sorted(users.items())]
+
+
+class PresenceTracker:
+    """Who is connected to and typing in each channel.
+
+    Typing frames from this worker's sockets are rate-limited per user and
+    expire `timeout` after the last accepted one. Instead of relaying every
+    keystroke, a flush loop compares each changed channel with what it last
+    published and sends one "typing_update" (started/stopped) and one
+    "presence_update" (online/offline) diff per `flush_interval`.
+
+    Every worker applies the diffs it receives from the broker in `apply()`,
+    which gives it the cluster-wide view used for snapshots and lets it
+    attach the full typing list to the event its clients receive. Diffs
+    carry the id of the worker that published them and the view remembers
+    which workers list each user, so a user connected through several
+    workers stays online until the last of them reports them gone.
+
+    Every `sync_interval` each worker also republishes its full online list
+    per channel. That brings workers started since up to date, and lets
+    every worker forget the users of a worker that stopped publishing
+    (e.g. one that crashed) after three intervals.
+    """
+
+    def __init__(self, publish: Publisher, timeout_ms: int = TYPING_TIMEOUT_MS,
+                 flush_ms: int = TYPING_FLUSH_MS, rate_limit_ms: int = TYPING_RATE_LIMIT_MS,
+                 sync_ms: int = PRESENCE_SYNC_MS):
+        self.publish = publish
+        self.timeout = timeout_ms / 1000
+        self.flush_interval = flush_ms / 1000
+        self.rate_limit = rate_limit_ms / 1000
+        self.sync_interval = sync_ms / 1000
+        self.worker_id = uuid.uuid4().hex[:12]
+        # State owned by this worker
+        self._connections: dict[int, Counter] = {}  # channel -> user id -> open sockets
+        self._usernames: dict[int, str] = {}
+        self._typing: dict[int, dict[int, float]] = {}  # channel -> user id -> expiry
+        self._last_typing: dict[tuple[int, int], float] = {}
+        self._published_online: dict[int, set[int]] = {}
+        self._published_typing: dict[int, set[int]] = {}
+        self._dirty: set[int] = set()
+        # Cluster-wide view, built from the diffs every worker publishes: channel -> user id -> workers
+        self._online_view: dict[int, dict[int, set[str]]] = {}
+        self._typing_view: dict[int, dict[int, set[str]]] = {}
+        self._names: dict[int, str] = {}
+        self._workers_seen: dict[str, float] = {}
+        self._last_sync = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.accepted = 0
+        self.rate_limited = 0
+        self.published = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # --- Local state changes ---
+    def connected(self, channel_id: int, user_id: int, username: str):
+        self._usernames[user_id] = username
+        self._connections.setdefault(channel_id, Counter())[user_id] += 1
+        self._dirty.add(channel_id)
+
+    def disconnected(self, channel_id: int, user_id: int):
+        connections = self._connections.get(channel_id)
+        if connections is None or not connections[user_id]:
+            return
+        connections[user_id] -= 1
+        if not connections[user_id]:
+            del connections[user_id]
+            self.stopped_typing(channel_id, user_id)
+        self._dirty.add(channel_id)
+
+    def typing(self, channel_id: int, user_id: int, username: str) -> bool:
+        """Record a typing frame; False if it arrived within the rate limit and was ignored"""
+        now = time.monotonic()
+        key = (channel_id, user_id)
+        if now - self._last_typing.get(key, float("-inf")) < self.rate_limit:
+            self.rate_limited += 1
+            return False
+        self._last_typing[key] = now
+        self._usernames[user_id] = username
+        typing = self._typing.setdefault(channel_id, {})
+        if user_id not in typing:
+            self._dirty.add(channel_id)
+        typing[user_id] = now + self.timeout
+        self.accepted += 1
+        return True
+
+    def stopped_typing(self, channel_id: int, user_id: int):
+        """The user sent their message or left: clear their indicator on the next flush"""
+        typing = self._typing.get(channel_id)
+        if typing and typing.pop(user_id, None) is not None:
+            self._dirty.add(channel_id)
+        self._last_typing.pop((channel_id, user_id), None)
+
+    # --- Publishing ---
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_sync >= self.sync_interval:
+                    await self.sync()
+            except Exception as e:
+                print(f"Error publishing presence updates: {e}")
+
+    async def flush(self):
+        now = time.monotonic()
+        for channel_id, typing in self._typing.items():
+            expired = [user_id for user_id, expires in typing.items() if expires <= now]
+            for user_id in expired:
+                del typing[user_id]
+                self._last_typing.pop((channel_id, user_id), None)
+            if expired:
+                self._dirty.add(channel_id)
+
+        dirty, self._dirty = self._dirty, set()
+        for channel_id in dirty:
+            online = set(self._connections.get(channel_id, ()))
+            typing = set(self._typing.get(channel_id, ()))
+            await self._publish_diff(channel_id, "presence_update", ("online", "offline"),
+                                     online, self._published_online)
+            await self._publish_diff(channel_id, "typing_update", ("started", "stopped"),
+                                     typing, self._published_typing)
+            # Read again: a user may have connected while the diffs were being published
+            if not self._connections.get(channel_id) and not self._typing.get(channel_id):
+                self._connections.pop(channel_id, None)
+                self._typing.pop(channel_id, None)
+
+    async def _publish_diff(self, channel_id: int, event_type: str, names: tuple[str, str],
+                            current: set[int], published: dict[int, set[int]]):
+        before = published.get(channel_id, set())
+        added, removed = current - before, before - current
+        if not added and not removed:
+            return
+        if current:
+            published[channel_id] = current
+        else:
+            published.pop(channel_id, None)
+        await self.publish(channel_id, {
+            "type": event_type,
+            "worker": self.worker_id,
+            names[0]: _users({user_id: self._usernames[user_id] for user_id in added}),
+            names[1]: _users({user_id: self._usernames[user_id] for user_id in removed}),
+        })
+        self.published += 1
+
+    async def sync(self):
+        """Republish this worker's full online list for every channel it has users in"""
+        self._last_sync = time.monotonic()
+        for channel_id, online in list(self._published_online.items()):
+            await self.publish(channel_id, {
+                "type": "presence_update",
+                "worker": self.worker_id,
+                "sync": True,
+                "online": _users({user_id: self._usernames[user_id] for user_id in online}),
+                "offline": [],
+            })
+        self._forget_silent_workers()
+
+    # --- Cluster-wide view ---
+    def apply(self, channel_id: int, event: Event) -> Optional[Event]:
+        """Fold a published diff into the view.
+
+        Presence updates are reduced to the users who actually came online or
+        went offline cluster-wide, and None when that is nobody; typing
+        updates gain the channel's full typing list.
+        """
+        if event.type not in ("presence_update", "typing_update"):
+            return event
+        payload = event.payload
+        worker = payload.get("worker")
+        self._workers_seen[worker] = time.monotonic()
+        if event.type == "presence_update":
+            removed = payload["offline"]
+            if payload.get("sync"):
+                # A full list: whoever this worker listed before but not now has gone
+                listed = {user["id"] for user in payload["online"]}
+                removed = [{"id": user_id, "username": self._names[user_id]}
+                           for user_id, workers in self._online_view.get(channel_id, {}).items()
+                           if worker in workers and user_id not in listed]
+            online, offline = self._merge(self._online_view, channel_id, worker, payload["online"], removed)
+            # The worker's sockets for these users are gone, and with them its typing indicators
+            self._merge(self._typing_view, channel_id, worker, [], removed)
+            if not online and not offline:
+                return None
+            return Event({**payload, "online": online, "offline": offline})
+        self._merge(self._typing_view, channel_id, worker, payload["started"], payload["stopped"])
+        # Clients can render the list as-is, so a coalesced (replaced) update loses nothing
+        return Event({**payload, "typing": self._listed(self._typing_view, channel_id)})
+
+    def _merge(self, view: dict[int, dict[int, set[str]]], channel_id: int, worker: str,
+               added: list, removed: list) -> tuple[list, list]:
+        """Apply one worker's additions and removals; returns the users that appeared and disappeared"""
+        users = view.setdefault(channel_id, {})
+        appeared, gone = [], []
+        for user in added:
+            self._names[user["id"]] = user["username"]
+            workers = users.setdefault(user["id"], set())
+            if not workers:
+                appeared.append(user)
+            workers.add(worker)
+        for user in removed:
+            workers = users.get(user["id"])
+            if workers is None:
+                continue
+            workers.discard(worker)
+            if not workers:
+                del users[user["id"]]
+                gone.append(user)
+        if not users:
+            view.pop(channel_id, None)
+        return appeared, gone
+
+    def _forget_silent_workers(self):
+        cutoff = time.monotonic() - 3 * self.sync_interval
+        silent = {worker for worker, seen in self._workers_seen.items() if seen < cutoff and worker != self.worker_id}
+        if not silent:
+            return
+        for view in (self._online_view, self._typing_view):
+            for channel_id, users in list(view.items()):
+                for user_id, workers in list(users.items()):
+                    workers -= silent
+                    if not workers:
+                        del users[user_id]
+                if not users:
+                    del view[channel_id]
+        for worker in silent:
+            del self._workers_seen[worker]
+
+    def _listed(self, view: dict[int, dict[int, set[str]]], channel_id: int) -> list[dict]:
+        return _users({user_id: self._names[user_id] for user_id in view.get(channel_id, ())})
+
+    def snapshot(self, channel_id: int) -> dict:
+        return {
+            "online": self._listed(self._online_view, channel_id),
+            "typing": self._listed(self._typing_view, channel_id),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self._online_view),
+            "typing_accepted": self.accepted,
+            "typing_rate_limited": self.rate_limited,
+            "updates_published": self.published,
+        }
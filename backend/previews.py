@@ -0,0 +1,140 @@
+"""
+Background thumbnail and preview-metadata generation for uploaded attachments
+"""
+import asyncio
+import mimetypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import database
+import models
+import storage
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+PREVIEW_MAX_SIZE = int(os.getenv("PREVIEW_MAX_SIZE", "320"))  # Longest thumbnail edge in pixels
+THUMBNAIL_SUFFIX = ".thumb.webp"
+
+# Called with a file_url once its attachment metadata (and thumbnail, for images) is stored
+ReadyCallback = Callable[[str], Awaitable[None]]
+
+
+def renders(mime_type: Optional[str]) -> bool:
+    """Whether uploads of this type get a thumbnail (and so stay pending until it is rendered)"""
+    return PIL_AVAILABLE and bool(mime_type) and mime_type.startswith("image/") and mime_type != "image/svg+xml"
+
+
+def thumbnail_path(blob_path: Path) -> Path:
+    return blob_path.with_name(blob_path.name.split(".")[0] + THUMBNAIL_SUFFIX)
+
+
+def render_thumbnail(source: str, target: str, max_size: int) -> dict:
+    """Read an image's dimensions and write a downscaled WebP copy (runs in a worker process)"""
+    with Image.open(source) as image:
+        width, height = image.size
+        # Lets the JPEG decoder skip straight to a reduced scale for big photos
+        image.draft("RGB", (max_size, max_size))
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        # Write under a temporary name so readers never see a half-written thumbnail
+        image.save(target + ".tmp", "WEBP", quality=80)
+    os.replace(target + ".tmp", target)
+    return {"width": width, "height": height}
+
+
+class PreviewPipeline:
+    """Records attachment metadata on upload and renders thumbnails in a process pool.
+
+    `submit()` returns immediately; the mime type and size are stored right
+    away and the dimensions and thumbnail URL are filled in once the worker
+    process has rendered the image. `on_ready` is then awaited with the file
+    URL, so anything that cached the message before that can refresh it.
+    """
+
+    def __init__(self, workers: int = PREVIEW_WORKERS, max_size: int = PREVIEW_MAX_SIZE,
+                 on_ready: Optional[ReadyCallback] = None):
+        self.workers = workers
+        self.max_size = max_size
+        self.on_ready = on_ready
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, blob: storage.StoredBlob):
+        task = asyncio.create_task(self._process(blob))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def shutdown(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _process(self, blob: storage.StoredBlob):
+        attachment_id = None
+        try:
+            attachment_id = await self._record(blob)
+            if attachment_id is None:
+                return  # Already known: an identical blob was processed before
+            if renders(mimetypes.guess_type(blob.path.name)[0]):
+                await self._render(attachment_id, blob)
+        except Exception as e:
+            print(f"Preview generation failed for {blob.url}: {e}")
+        if attachment_id is not None and self.on_ready is not None:
+            try:
+                await self.on_ready(blob.url)
+            except Exception as e:
+                print(f"Error announcing preview for {blob.url}: {e}")
+
+    async def _record(self, blob: storage.StoredBlob) -> Optional[int]:
+        async with database.AsyncSessionLocal() as db:
+            existing = await db.execute(select(models.Attachment.id).where(models.Attachment.url == blob.url))
+            if existing.scalar() is not None:
+                return None
+            attachment = models.Attachment(
+                url=blob.url,
+                sha256=blob.sha256,
+                filename=blob.filename,
+                mime_type=mimetypes.guess_type(blob.path.name)[0] or "application/octet-stream",
+                size=blob.size,
+            )
+            db.add(attachment)
+            try:
+                await db.commit()
+            except IntegrityError:
+                return None  # The same blob was uploaded concurrently
+            return attachment.id
+
+    async def _render(self, attachment_id: int, blob: storage.StoredBlob):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        target = thumbnail_path(blob.path)
+        metadata = await asyncio.get_running_loop().run_in_executor(
+            self._executor, render_thumbnail, str(blob.path), str(target), self.max_size
+        )
+        async with database.AsyncSessionLocal() as db:
+            attachment = await db.get(models.Attachment, attachment_id)
+            attachment.width = metadata["width"]
+            attachment.height = metadata["height"]
+            attachment.thumbnail_url = "/uploads/" + target.relative_to(storage.UPLOAD_DIR).as_posix()
+            await db.commit()
+
+
+async def lookup(db, file_url: Optional[str]) -> Optional[models.Attachment]:
+    """Preview metadata for a message's file_url, if it points at a recorded attachment"""
+    if not file_url:
+        return None
+    result = await db.execute(select(models.Attachment).where(models.Attachment.url == file_url))
+    return result.scalars().first()
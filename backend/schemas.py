@@ -16,16 +16,47 @@ class UserCreate(BaseModel):
     password: str
 
 
+class AttachmentPreview(BaseModel):
+    """Thumbnail and metadata for a message's file; width/height/thumbnail are None until rendered"""
+    url: str
+    filename: str | None = None
+    mime_type: str | None = None
+    size: int | None = None
+    width: int | None = None
+    height: int | None = None
+    thumbnail_url: str | None = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class Message(BaseModel):
     id: int
     content: str
     owner: User # This will nest the User's info inside the message
     timestamp: datetime | None = None
     file_url: str | None = None
+    attachment: AttachmentPreview | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class MessagePage(BaseModel):
+    """A newest-first page of channel history plus the cursor for the next page"""
+    messages: list[Message] = []
+    next_cursor: int | None = None
+
+
+class SearchHit(Message):
+    channel_id: int
+    score: float | None = None
+
+
+class SearchPage(BaseModel):
+    """Ranked search results plus the cursor for the next page (None on the last page)"""
+    results: list[SearchHit] = []
+    next_cursor: int | None = None
+
+
 class Channel(BaseModel):
     id: int
     name: str
@@ -67,4 +98,14 @@ class Token(BaseModel):
 
 
 class TokenData(BaseModel):
-    email: str | None = None
\ No newline at end of file
+    email: str | None = None
+
+class PresenceUser(BaseModel):
+    id: int
+    username: str
+
+
+class PresenceSnapshot(BaseModel):
+    """Users connected to and typing in a channel, as last published by every worker"""
+    online: list[PresenceUser] = []
+    typing: list[PresenceUser] = []
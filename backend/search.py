@@ -0,0 +1,199 @@
+"""
+Full-text message search: Postgres tsvector/GIN when available, an in-process inverted index otherwise
+"""
+import asyncio
+import math
+import os
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+import database
+import events
+import models
+from lexical_index import tokenize
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "25"))
+MAX_SEARCH_PAGE_SIZE = 100
+# Relevance-sorted results are paged by offset; deeper pages should narrow the query instead
+MAX_SEARCH_OFFSET = int(os.getenv("MAX_SEARCH_OFFSET", "1000"))
+BACKFILL_BATCH_SIZE = 5000
+
+SORTS = ("relevance", "recent")
+
+
+class InvertedIndex:
+    """Term -> {message id: term frequency}, scored with BM25 at query time.
+
+    Used when the database has no full-text index (SQLite in development and
+    tests). It is filled from the messages table once at startup and then kept
+    current from the message events every worker already receives.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = {}
+        self._documents: dict[int, tuple[int, int]] = {}  # id -> (channel_id, length)
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, message_id: int, channel_id: int, content: Optional[str]):
+        if message_id in self._documents:
+            return  # Already indexed: backfill and live events may overlap
+        tokens = tokenize(content or "")
+        self._documents[message_id] = (channel_id, len(tokens))
+        self._total_length += len(tokens)
+        for term, count in Counter(tokens).items():
+            self._postings.setdefault(term, {})[message_id] = count
+
+    def search(self, query: str, channel_ids: Optional[set[int]] = None) -> list[tuple[int, float]]:
+        """(message id, score) for messages containing every query term, unsorted"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or any(term not in self._postings for term in terms):
+            return []
+        # Intersect starting from the rarest term to keep the candidate set small
+        postings = sorted((self._postings[term] for term in terms), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+        if channel_ids is not None:
+            candidates = {m for m in candidates if self._documents[m][0] in channel_ids}
+
+        documents = len(self._documents)
+        average_length = self._total_length / documents or 1
+        idf = [math.log1p((documents - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+        results = []
+        for message_id in candidates:
+            length = self._documents[message_id][1]
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            score = sum(w * p[message_id] * (self.k1 + 1) / (p[message_id] + norm) for w, p in zip(idf, postings))
+            results.append((message_id, score))
+        return results
+
+    def stats(self) -> dict:
+        return {"messages": len(self._documents), "terms": len(self._postings)}
+
+
+class MessageSearch:
+    """Ranked, paginated message search over channels.
+
+    On Postgres, queries run against the GIN expression index declared on
+    models.Message, which the database maintains as rows are inserted.
+    Elsewhere an InvertedIndex is built at startup and updated through
+    `observe()` as message events are published.
+    """
+
+    def __init__(self):
+        self.fallback: Optional[InvertedIndex] = None
+        self._backfill: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if database.async_engine.dialect.name == "postgresql":
+            return
+        self.fallback = InvertedIndex()
+        self._backfill = asyncio.create_task(self._load_existing())
+
+    async def stop(self):
+        if self._backfill is not None and not self._backfill.done():
+            self._backfill.cancel()
+
+    async def _load_existing(self):
+        last_id = 0
+        while True:
+            async with database.AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(models.Message.id, models.Message.channel_id, models.Message.content)
+                    .where(models.Message.id > last_id)
+                    .order_by(models.Message.id)
+                    .limit(BACKFILL_BATCH_SIZE)
+                )).all()
+            for row in rows:
+                self.fallback.add(row.id, row.channel_id, row.content)
+            if len(rows) < BACKFILL_BATCH_SIZE:
+                return
+            last_id = rows[-1].id
+
+    def observe(self, channel_id: int, event: events.Event):
+        """Index a published chat message (no-op when Postgres does the indexing)"""
+        if self.fallback is None or event.type != "message":
+            return
+        payload = event.payload
+        if payload.get("id") is not None:
+            self.fallback.add(payload["id"], channel_id, payload.get("content"))
+
+    async def search(self, db: AsyncSession, query: str, channel_ids: list[int],
+                     sort: str = "relevance", cursor: Optional[int] = None,
+                     limit: int = SEARCH_PAGE_SIZE) -> tuple[list[tuple[models.Message, float]], Optional[int]]:
+        """A page of (message, score) matching `query` within `channel_ids`, plus the next cursor.
+
+        For "relevance" the cursor is an offset; for "recent" it is the id of
+        the last message on the previous page (keyset pagination).
+        """
+        if not channel_ids or not query.strip():
+            return [], None
+        if self.fallback is not None:
+            ranked = await self._search_fallback(query, channel_ids, sort, cursor, limit)
+        else:
+            ranked = await self._search_postgres(db, query, channel_ids, sort, cursor, limit)
+
+        has_more = len(ranked) > limit
+        ranked = ranked[:limit]
+        if sort == "recent":
+            next_cursor = ranked[-1][0] if has_more else None
+        else:
+            offset = cursor or 0
+            next_cursor = offset + limit if has_more and offset + limit <= MAX_SEARCH_OFFSET else None
+
+        if not ranked:
+            return [], None
+        rows = (await db.execute(
+            select(models.Message)
+            .options(joinedload(models.Message.owner), joinedload(models.Message.attachment))
+            .where(models.Message.id.in_([message_id for message_id, _ in ranked]))
+        )).scalars().all()
+        by_id = {message.id: message for message in rows}
+        return [(by_id[message_id], score) for message_id, score in ranked if message_id in by_id], next_cursor
+
+    async def _search_postgres(self, db: AsyncSession, query: str, channel_ids: list[int],
+                               sort: str, cursor: Optional[int], limit: int) -> list[tuple[int, float]]:
+        document = models.content_tsvector(models.Message.content)
+        tsquery = func.websearch_to_tsquery(models.search_config(), query)
+        rank = func.ts_rank_cd(document, tsquery)
+        statement = (
+            select(models.Message.id, rank.label("rank"))
+            .where(document.bool_op("@@")(tsquery))
+            .where(models.Message.channel_id.in_(channel_ids))
+            .limit(limit + 1)
+        )
+        if sort == "recent":
+            if cursor is not None:
+                statement = statement.where(models.Message.id < cursor)
+            statement = statement.order_by(models.Message.id.desc())
+        else:
+            statement = statement.order_by(rank.desc(), models.Message.id.desc()).offset(cursor or 0)
+        return [(row.id, float(row.rank)) for row in (await db.execute(statement)).all()]
+
+    async def _search_fallback(self, query: str, channel_ids: list[int],
+                               sort: str, cursor: Optional[int], limit: int) -> list[tuple[int, float]]:
+        if self._backfill is not None and not self._backfill.done():
+            await asyncio.shield(self._backfill)
+        hits = self.fallback.search(query, set(channel_ids))
+        if sort == "recent":
+            if cursor is not None:
+                hits = [hit for hit in hits if hit[0] < cursor]
+            hits.sort(key=lambda hit: hit[0], reverse=True)
+            return hits[:limit + 1]
+        hits.sort(key=lambda hit: (hit[1], hit[0]), reverse=True)
+        offset = cursor or 0
+        return hits[offset:offset + limit + 1]
+
+    def stats(self) -> dict:
+        if self.fallback is None:
+            return {"backend": "postgresql"}
+        return {"backend": "memory", **self.fallback.stats()}
@@ -0,0 +1,315 @@
+"""
+Semantic search over chat history, built on the FAQ bot's sentence-transformer and FAISS stack
+"""
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+import bot as bot_module
+import database
+import events
+import models
+import vector_index
+
+if bot_module.FAISS_AVAILABLE:
+    import faiss
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves from several workers are not coordinated
+    fcntl = None
+
+SEMANTIC_SEARCH = os.getenv("SEMANTIC_SEARCH", "auto")  # "off" disables the indexer
+SEMANTIC_BATCH_SIZE = int(os.getenv("SEMANTIC_BATCH_SIZE", "64"))
+SEMANTIC_BATCH_WAIT_MS = float(os.getenv("SEMANTIC_BATCH_WAIT_MS", "200"))
+SEMANTIC_MIN_SIMILARITY = float(os.getenv("SEMANTIC_MIN_SIMILARITY", "0.3"))
+# Per-server indexes are saved here so restarts and other workers only embed new messages; empty disables
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "semantic_index")
+
+
+def _lock_file(lock_file, exclusive: bool):
+    """Serialize saves (and loads against them) across worker processes; released on close"""
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+class SemanticIndexer:
+    """Embeds chat messages in the background into one cosine FAISS index per server.
+
+    Nothing is embedded until the index is first needed: the first semantic
+    search, or a message arriving once the bot has loaded the model anyway.
+    The indexer then loads the newest save (written by any worker), embeds
+    every message since its watermark and picks up newer messages from
+    published message events in batches of up to `batch_size`. Until it has
+    caught up, and whenever the model is unavailable, `search()` returns
+    None so the caller can fall back to keyword search.
+    """
+
+    def __init__(self, batch_size: int = SEMANTIC_BATCH_SIZE, wait_ms: float = SEMANTIC_BATCH_WAIT_MS,
+                 index_dir: str = SEMANTIC_INDEX_DIR):
+        self.enabled = bot_module.FAISS_AVAILABLE and SEMANTIC_SEARCH != "off" and bot_module.BOT_BACKEND != "lexical"
+        self.batch_size = batch_size
+        self.wait = wait_ms / 1000
+        self.index_dir = Path(index_dir) if index_dir else None
+        self._indexes: dict[int, object] = {}
+        self._channel_servers: dict[int, int] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Messages up to this id come from the backfill, later ones from events
+        self._boundary: Optional[int] = None
+        self.watermark = 0  # Every message up to this id is in the indexes
+        self.caught_up = False
+        self._task: Optional[asyncio.Task] = None
+        self._backfill: Optional[asyncio.Task] = None
+        # One embedding thread, so indexing never competes with itself for the model
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-index")
+        # FAISS indexes are not safe to search while another thread adds to them
+        self._lock = threading.Lock()
+        self.indexed = 0
+
+    @property
+    def bot(self) -> bot_module.RAGBot:
+        return bot_module.get_bot()
+
+    @property
+    def available(self) -> bool:
+        """The bot is on the embedding backend; it switches to "lexical" if the model fails to load"""
+        return self.enabled and self.bot.backend == "faiss"
+
+    async def stop(self):
+        if self._backfill is None:
+            return  # Never needed, nothing to save
+        if not self._backfill.done():
+            self._backfill.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            batch = []
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch and self.available:
+                await self._index(batch)
+        # A half-finished backfill would leave gaps below the live messages: keep the previous save
+        if self.caught_up:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._save)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def observe(self, channel_id: int, event: events.Event):
+        """Queue a published chat message for embedding"""
+        if self._task is None:
+            if self._backfill is None and self.available and self.bot.model_loaded:
+                self._start()  # The bot already paid for loading the model
+            return
+        if event.type != "message":
+            return
+        payload = event.payload
+        message_id = payload.get("id")
+        if message_id is not None and message_id > self._boundary:
+            if payload.get("content"):
+                self._queue.put_nowait((message_id, channel_id, payload["content"]))
+
+    def _start(self):
+        if self._backfill is None:
+            self._backfill = asyncio.create_task(self._catch_up())
+
+    async def _catch_up(self):
+        """Load the newest save, then embed the messages written since it"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._load)
+            async with database.AsyncSessionLocal() as db:
+                self._boundary = (await db.execute(select(func.max(models.Message.id)))).scalar() or 0
+            self._task = asyncio.create_task(self._run())
+            after_id = self.watermark
+            while after_id < self._boundary:
+                async with database.AsyncSessionLocal() as db:
+                    rows = (await db.execute(
+                        select(models.Message.id, models.Message.channel_id, models.Message.content)
+                        .where(models.Message.id > after_id, models.Message.id <= self._boundary)
+                        .order_by(models.Message.id)
+                        .limit(self.batch_size)
+                    )).all()
+                if not rows:
+                    break
+                await self._index([(row.id, row.channel_id, row.content) for row in rows if row.content])
+                after_id = rows[-1].id
+        except Exception as e:
+            print(f"Error building semantic index: {e}")
+            if self._task is not None:
+                self._task.cancel()
+                self._task = None
+            self._backfill = None  # The next search tries again
+            return
+        self.watermark = self._boundary
+        self.caught_up = True
+        # Saved right away so workers that start indexing later begin from here
+        try:
+            await loop.run_in_executor(self._executor, self._save)
+        except Exception as e:
+            print(f"Error saving semantic index: {e}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._index(batch)
+            except Exception as e:
+                print(f"Error indexing messages for semantic search: {e}")
+
+    async def _index(self, batch: list[tuple[int, int, str]]):
+        if not batch:
+            return
+        servers = await self._servers_for({channel_id for _, channel_id, _ in batch})
+        batch = [item for item in batch if item[1] in servers]
+        if not batch:
+            return
+        ids = np.array([message_id for message_id, _, _ in batch], dtype="int64")
+        server_ids = np.array([servers[channel_id] for _, channel_id, _ in batch])
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._add, [content for _, _, content in batch], ids, server_ids
+        )
+        if self.caught_up:
+            self.watermark = max(self.watermark, int(ids.max()))
+        self.indexed += len(batch)
+
+    def _add(self, texts: list[str], ids: np.ndarray, server_ids: np.ndarray):
+        embeddings = self.bot.embed(texts)
+        with self._lock:
+            for server_id in np.unique(server_ids):
+                rows = server_ids == server_id
+                index = self._indexes.get(int(server_id))
+                if index is None:
+                    index, _ = vector_index.build_index(embeddings[:0], ids[:0], "flat", "cosine")
+                    self._indexes[int(server_id)] = index
+                index.add_with_ids(np.ascontiguousarray(embeddings[rows]), ids[rows])
+
+    async def _servers_for(self, channel_ids: set[int]) -> dict[int, int]:
+        missing = [channel_id for channel_id in channel_ids if channel_id not in self._channel_servers]
+        if missing:
+            async with database.AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(models.Channel.id, models.Channel.server_id).where(models.Channel.id.in_(missing))
+                )).all()
+            self._channel_servers.update({row.id: row.server_id for row in rows})
+        return {channel_id: self._channel_servers[channel_id]
+                for channel_id in channel_ids if channel_id in self._channel_servers}
+
+    async def search(self, db: AsyncSession, server_id: int, query: str, channel_id: Optional[int] = None,
+                     limit: int = 25) -> Optional[list[tuple[models.Message, float]]]:
+        """Messages in a server (optionally one channel) closest in meaning to `query`, best first.
+
+        None when semantic search can't answer yet: no model, or the index is still catching up.
+        """
+        if not self.available:
+            return None
+        self._start()
+        if not self.caught_up:
+            return None
+        index = self._indexes.get(server_id)
+        if index is None or index.ntotal == 0:
+            return []
+        # Over-fetch when filtering to one channel; the channel is checked against the database rows
+        k = min(index.ntotal, limit * 4 if channel_id is not None else limit)
+        try:
+            similarities, ids = await asyncio.to_thread(self._search, index, query, k)
+        except RuntimeError:
+            return None  # The model failed to load; the bot is now on the keyword backend
+        scores = {int(i): float(s) for i, s in zip(ids[0], similarities[0]) if i >= 0 and s >= SEMANTIC_MIN_SIMILARITY}
+        if not scores:
+            return []
+        statement = (
+            select(models.Message)
+            .options(joinedload(models.Message.owner), joinedload(models.Message.attachment))
+            .where(models.Message.id.in_(list(scores)))
+        )
+        if channel_id is not None:
+            statement = statement.where(models.Message.channel_id == channel_id)
+        messages = (await db.execute(statement)).scalars().all()
+        ranked = sorted(messages, key=lambda message: scores[message.id], reverse=True)[:limit]
+        return [(message, scores[message.id]) for message in ranked]
+
+    def _search(self, index, query: str, k: int):
+        embedding = self.bot.embed([query])
+        with self._lock:
+            return index.search(embedding, k)
+
+    # --- Persistence, shared by every worker on the host ---
+    def _read_manifest(self) -> Optional[dict]:
+        manifest_path = self.index_dir / "manifest.json"
+        return json.loads(manifest_path.read_text()) if manifest_path.exists() else None
+
+    def _save(self):
+        """Write the indexes unless another worker already saved a newer copy"""
+        if self.index_dir is None:
+            return
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.index_dir / ".lock", "w") as lock_file:
+            _lock_file(lock_file, exclusive=True)
+            current = self._read_manifest()
+            if current and current.get("model_name") == self.bot.model_name and current.get("watermark", 0) >= self.watermark:
+                return
+            files = {}
+            with self._lock:
+                for server_id, index in self._indexes.items():
+                    # Named after the watermark, so the previous save stays intact until the manifest moves on
+                    name = f"server_{server_id}.{self.watermark}.faiss"
+                    faiss.write_index(index, str(self.index_dir / (name + ".tmp")))
+                    os.replace(self.index_dir / (name + ".tmp"), self.index_dir / name)
+                    files[str(server_id)] = name
+            manifest = {"model_name": self.bot.model_name, "watermark": self.watermark, "servers": files}
+            manifest_path = self.index_dir / "manifest.json"
+            manifest_path.with_suffix(".tmp").write_text(json.dumps(manifest, indent=2))
+            os.replace(manifest_path.with_suffix(".tmp"), manifest_path)
+            for path in self.index_dir.glob("server_*.faiss"):
+                if path.name not in files.values():
+                    path.unlink(missing_ok=True)
+
+    def _load(self):
+        self._indexes = {}
+        self.watermark = 0
+        if self.index_dir is None or not self.index_dir.exists():
+            return
+        try:
+            with open(self.index_dir / ".lock", "w") as lock_file:
+                _lock_file(lock_file, exclusive=False)
+                manifest = self._read_manifest()
+                if manifest is None or manifest.get("model_name") != self.bot.model_name:
+                    return  # Embeddings from another model are not comparable: re-embed everything
+                indexes = {
+                    int(server_id): faiss.read_index(str(self.index_dir / name))
+                    for server_id, name in manifest["servers"].items()
+                }
+            with self._lock:
+                self._indexes = indexes
+            self.watermark = manifest["watermark"]
+        except Exception as e:
+            print(f"Warning: Could not load semantic index, rebuilding: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "available": self.available,
+            "servers": len(self._indexes),
+            "vectors": sum(index.ntotal for index in self._indexes.values()),
+            "indexed": self.indexed,
+            "queued": self._queue.qsize(),
+            "backfilling": self._backfill is not None and not self.caught_up,
+        }
@@ -0,0 +1,178 @@
+"""
+Streaming, content-addressed storage for uploaded attachments
+"""
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+# Partially received uploads live here until their hash is known; same filesystem as the blobs
+INCOMING_DIR = UPLOAD_DIR / ".incoming"
+
+
+class UploadError(Exception):
+    """The request did not contain a usable file upload"""
+
+
+class UploadTooLarge(UploadError):
+    """The upload is bigger than MAX_UPLOAD_BYTES"""
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    sha256: str
+    filename: str  # Name the client uploaded the file as
+    size: int
+    path: Path
+    deduplicated: bool  # An identical blob was already stored
+
+    @property
+    def url(self) -> str:
+        return "/uploads/" + self.path.relative_to(UPLOAD_DIR).as_posix()
+
+
+def _extension(filename: str) -> str:
+    # Keep a short, safe extension so the blob is still served with the right type
+    suffix = Path(filename).suffix.lower()
+    return suffix if re.fullmatch(r"\.[a-z0-9]{1,10}", suffix) else ""
+
+
+def blob_path(sha256: str, filename: str) -> Path:
+    return UPLOAD_DIR / sha256[:2] / f"{sha256}{_extension(filename)}"
+
+
+class BlobWriter:
+    """Writes one file to a temp file chunk by chunk, hashing as it goes.
+
+    File writes and hashing run in a worker thread so large uploads never
+    block the event loop. `commit()` moves the file to its content address,
+    or drops it when an identical blob is already stored.
+    """
+
+    def __init__(self, filename: str, max_bytes: Optional[int] = None):
+        self.filename = filename
+        self.max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+        self._temp_path = INCOMING_DIR / uuid.uuid4().hex
+        self._file = open(self._temp_path, "wb")
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge()
+        await asyncio.to_thread(self._write_chunk, chunk)
+
+    def _write_chunk(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    async def commit(self) -> StoredBlob:
+        return await asyncio.to_thread(self._commit)
+
+    def _commit(self) -> StoredBlob:
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        path = blob_path(sha256, self.filename)
+        deduplicated = path.exists()
+        if deduplicated:
+            self._temp_path.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._temp_path, path)
+        return StoredBlob(sha256, self.filename, self.size, path, deduplicated)
+
+    def abort(self):
+        self._file.close()
+        self._temp_path.unlink(missing_ok=True)
+
+
+async def receive_upload(request: Request, field: str = "file",
+                         max_bytes: Optional[int] = None) -> StoredBlob:
+    """Stream the `field` file part of a multipart request straight into blob storage.
+
+    The body is parsed as it arrives instead of being spooled first, so the
+    size limit is enforced (and the hash computed) while the upload is in flight.
+    """
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + 64 * 1024:
+        raise UploadTooLarge()  # Reject before reading a byte; 64 KiB covers multipart framing
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data upload")
+
+    # The parser calls back synchronously; data for the file part is collected
+    # per network chunk and written after each parser.write() call.
+    state = {"header_field": b"", "headers": {}, "target": None, "done": False}
+    pending: list[bytes] = []
+    writer: Optional[BlobWriter] = None
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["target"] = None
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        name = state["header_field"].lower()
+        state["headers"][name] = state["headers"].get(name, b"") + data[start:end]
+
+    def on_header_end():
+        state["header_field"] = b""
+
+    def on_headers_finished():
+        nonlocal writer
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if writer is None and disposition.get(b"name") == field.encode() and b"filename" in disposition:
+            state["target"] = disposition[b"filename"].decode("utf-8", "replace")
+            writer = BlobWriter(state["target"], max_bytes)
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["target"] is not None:
+            pending.append(data[start:end])
+
+    def on_part_end():
+        if state["target"] is not None:
+            state["done"] = True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if writer is not None and pending:
+                data = b"".join(pending)
+                pending.clear()
+                await writer.write(data)
+        parser.finalize()
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is None or not state["done"]:
+        if writer is not None:
+            writer.abort()
+        raise UploadError(f"No '{field}' file in upload")
+    return await writer.commit()
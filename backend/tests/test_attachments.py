@@ -0,0 +1,61 @@
+"""
+Regression tests for serving uploads: paths must stay inside UPLOAD_DIR
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
+
+import attachments  # noqa: E402
+import main  # noqa: E402
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    (uploads / "ab").mkdir(parents=True)
+    (uploads / "ab" / "hello.txt").write_text("hello")
+    (tmp_path / "secret.txt").write_text("secret")
+    monkeypatch.setattr(storage, "UPLOAD_DIR", uploads)
+    return uploads
+
+
+@pytest.fixture
+def client(upload_dir):
+    # No `with` block: the startup hooks (database, broker, bot) aren't needed to serve files
+    return TestClient(main.app)
+
+
+def test_serves_file_inside_upload_dir(client):
+    response = client.get("/uploads/ab/hello.txt")
+    assert response.status_code == 200
+    assert response.text == "hello"
+
+
+@pytest.mark.parametrize("url", ["/uploads//etc/passwd", "/uploads/%2Fetc%2Fpasswd"])
+def test_absolute_path_is_not_served(client, url):
+    assert client.get(url).status_code == 404
+
+
+@pytest.mark.parametrize("path", [
+    "/etc/passwd",
+    "C:/Windows/win.ini",
+    "C:secret.txt",
+    "\\secret.txt",
+    "../secret.txt",
+    "ab/../../secret.txt",
+    ".incoming/partial",
+])
+def test_resolve_rejects_paths_outside_upload_dir(upload_dir, path):
+    assert attachments.resolve(path) is None
+
+
+def test_resolve_rejects_symlink_out_of_upload_dir(upload_dir):
+    (upload_dir / "ab" / "link.txt").symlink_to(upload_dir.parent / "secret.txt")
+    assert attachments.resolve("ab/link.txt") is None
@@ -0,0 +1,53 @@
+"""
+Tests for the bot's batching encoder
+"""
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bot import BatchEncoder  # noqa: E402
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def encode_batch(texts):
+        calls.append(list(texts))
+        return np.ones((len(texts), 2))
+
+    async def scenario():
+        encoder = BatchEncoder(encode_batch, batch_size=8, wait_ms=20)
+        results = await asyncio.gather(*(encoder.encode(t) for t in ["a", "b", "a"]))
+        await encoder.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert calls == [["a", "b"]]
+    assert len(results) == 3
+
+
+def test_stop_fails_queued_and_in_flight_requests():
+    release = threading.Event()
+
+    def encode_batch(texts):
+        release.wait(5)
+        return np.ones((len(texts), 2))
+
+    async def scenario():
+        encoder = BatchEncoder(encode_batch, batch_size=1, wait_ms=0)
+        encoding = asyncio.create_task(encoder.encode("in flight"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(encoder.encode("queued"))
+        await asyncio.sleep(0.05)
+        await encoder.stop()
+        release.set()
+        return await asyncio.wait_for(asyncio.gather(encoding, queued, return_exceptions=True), 1)
+
+    results = asyncio.run(scenario())
+    assert [str(r) for r in results] == ["encoder stopped", "encoder stopped"]
+    assert all(isinstance(r, RuntimeError) for r in results)
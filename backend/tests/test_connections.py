@@ -0,0 +1,137 @@
+"""
+Tests for per-socket outbound queues: bounds, coalescing, dropping and slow-consumer disconnects
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from connections import Connection  # noqa: E402
+from events import Event  # noqa: E402
+
+
+class FakeWebSocket:
+    """Records frames; while `gate` is clear every send blocks, like a client that stopped reading"""
+
+    def __init__(self, blocked: bool = False):
+        self.sent: list[str] = []
+        self.close_code = None
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    async def send_text(self, data: str):
+        await self.gate.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data: bytes):
+        await self.gate.wait()
+        self.sent.append(data.decode())
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+def message(i: int) -> Event:
+    return Event({"type": "message", "id": i, "channel_id": 1})
+
+
+def typing(channel_id: int = 1, users: int = 1) -> Event:
+    return Event({"type": "typing_update", "channel_id": channel_id, "typing": list(range(users))})
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_queue_is_bounded_and_new_ephemeral_events_are_dropped():
+    async def run():
+        connection = Connection(FakeWebSocket(), user_id=1, max_queue=3, policy="drop")
+        for i in range(3):
+            connection.enqueue(message(i))
+        connection.enqueue(typing())
+        assert len(connection._queue) == 3
+        assert all(item.key is None for item in connection._queue)
+        assert not connection._overflowed
+    asyncio.run(run())
+
+
+def test_message_evicts_a_queued_ephemeral_event_when_full():
+    async def run():
+        connection = Connection(FakeWebSocket(), user_id=1, max_queue=2, policy="drop")
+        connection.enqueue(typing())
+        connection.enqueue(message(1))
+        connection.enqueue(message(2))
+        assert [item.event.payload["id"] for item in connection._queue] == [1, 2]
+        assert not connection._pending
+    asyncio.run(run())
+
+
+def test_coalesce_replaces_the_queued_ephemeral_event_for_the_channel():
+    async def run():
+        connection = Connection(FakeWebSocket(), user_id=1, policy="coalesce")
+        connection.enqueue(typing(users=1))
+        connection.enqueue(message(1))
+        latest = typing(users=2)
+        connection.enqueue(latest)
+        connection.enqueue(typing(channel_id=2))
+        assert len(connection._queue) == 3
+        assert connection._queue[0].event is latest
+    asyncio.run(run())
+
+
+def test_drop_policy_keeps_ephemeral_events_separate():
+    async def run():
+        connection = Connection(FakeWebSocket(), user_id=1, policy="drop")
+        connection.enqueue(typing(users=1))
+        connection.enqueue(typing(users=2))
+        assert len(connection._queue) == 2
+    asyncio.run(run())
+
+
+def test_writer_sends_in_order():
+    async def run():
+        websocket = FakeWebSocket()
+        connection = Connection(websocket, user_id=1)
+        connection.start()
+        for i in range(5):
+            connection.enqueue(message(i))
+        await settle()
+        assert websocket.sent == [message(i).text for i in range(5)]
+        connection.stop()
+    asyncio.run(run())
+
+
+def test_disconnect_policy_closes_the_socket_on_overflow():
+    async def run():
+        websocket = FakeWebSocket()
+        connection = Connection(websocket, user_id=1, max_queue=2, policy="disconnect")
+        for i in range(3):
+            connection.enqueue(message(i))
+        connection.start()
+        await settle()
+        assert websocket.close_code == 1013
+        assert connection.closed
+        assert websocket.sent == []
+    asyncio.run(run())
+
+
+def test_overflow_during_an_in_flight_send_closes_the_socket():
+    for policy in ("disconnect", "coalesce"):
+        async def run():
+            websocket = FakeWebSocket(blocked=True)
+            connection = Connection(websocket, user_id=1, max_queue=3, policy=policy)
+            connection.start()
+            connection.enqueue(message(0))
+            await settle()  # The writer is now stuck sending message 0
+            for i in range(1, 6):
+                connection.enqueue(message(i))
+            assert connection._overflowed
+            websocket.gate.set()
+            await settle()
+            assert len(websocket.sent) == 1
+            assert websocket.close_code == 1013
+            assert connection.closed
+        asyncio.run(run())
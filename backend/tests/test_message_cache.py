@@ -0,0 +1,55 @@
+"""
+Tests for the hot-channel message cache
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import schemas  # noqa: E402
+from message_cache import RecentMessages  # noqa: E402
+
+
+def message(i: int, file_url: str | None = None) -> schemas.Message:
+    return schemas.Message(
+        id=i, content=f"m{i}", timestamp=datetime.now(timezone.utc), file_url=file_url,
+        owner=schemas.User(id=1, username="alice", email="alice@example.com"),
+    )
+
+
+def cached(cache: RecentMessages, channel_id: int = 1) -> list[int]:
+    return [m.id for m in cache.latest(channel_id, cache.capacity)]
+
+
+def load(cache: RecentMessages, ids: list[int], channel_id: int = 1):
+    async def fetch(count):
+        return [message(i) for i in sorted(ids, reverse=True)[:count]]
+    asyncio.run(cache.load(channel_id, fetch))
+
+
+def test_append_keeps_ids_sorted():
+    cache = RecentMessages(capacity=5)
+    load(cache, [1, 2, 4])
+    cache.append(1, message(5))
+    cache.append(1, message(3))
+    assert cached(cache) == [5, 4, 3, 2, 1]
+
+
+def test_append_skips_messages_a_load_already_picked_up():
+    cache = RecentMessages(capacity=5)
+    load(cache, [1, 2, 3])
+    cache.append(1, message(3))  # Newest: the append branch
+    cache.append(1, message(2))  # Older: the bisect-insert branch
+    assert cached(cache) == [3, 2, 1]
+
+
+def test_invalidate_file_drops_only_channels_showing_it():
+    cache = RecentMessages(capacity=5)
+    load(cache, [1], channel_id=1)
+    load(cache, [2], channel_id=2)
+    cache.append(1, message(3, file_url="/uploads/ab/abc.png"))
+    cache.invalidate_file("/uploads/ab/abc.png")
+    assert cache.latest(1, 1) is None
+    assert cached(cache, 2) == [2]
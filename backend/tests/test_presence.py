@@ -0,0 +1,96 @@
+"""
+Tests for presence diffs: flush races and the cluster-wide view built from several workers
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from events import Event  # noqa: E402
+from presence import PresenceTracker  # noqa: E402
+
+
+class Cluster:
+    """Workers sharing one in-process broker: every published diff is applied by every worker"""
+
+    def __init__(self, count: int, **options):
+        self.delivered: list[dict] = []
+        self.workers = [PresenceTracker(self.publish, **options) for _ in range(count)]
+
+    async def publish(self, channel_id: int, payload: dict):
+        event = Event({**payload, "channel_id": channel_id})
+        for worker in self.workers:
+            applied = worker.apply(channel_id, event)
+        if applied is not None:
+            self.delivered.append(applied.payload)
+
+
+def online(tracker: PresenceTracker, channel_id: int = 1) -> list[int]:
+    return [user["id"] for user in tracker.snapshot(channel_id)["online"]]
+
+
+def test_connect_during_flush_is_not_lost():
+    async def run():
+        async def publish(channel_id, payload):
+            await asyncio.sleep(0)
+            if payload.get("offline"):
+                tracker.connected(1, 8, "bob")  # Arrives while alice's offline diff is being published
+
+        tracker = PresenceTracker(publish)
+        tracker.connected(1, 7, "alice")
+        await tracker.flush()
+        tracker.disconnected(1, 7)
+        await tracker.flush()
+        assert tracker._connections.get(1) == {8: 1}
+        tracker.disconnected(1, 8)
+        assert 1 not in tracker._connections or not tracker._connections[1]
+    asyncio.run(run())
+
+
+def test_user_stays_online_until_every_worker_reports_them_gone():
+    async def run():
+        cluster = Cluster(2)
+        a, b = cluster.workers
+        a.connected(1, 7, "alice")
+        b.connected(1, 7, "alice")
+        await a.flush()
+        await b.flush()
+        a.disconnected(1, 7)
+        await a.flush()
+        assert online(a) == online(b) == [7]
+        b.disconnected(1, 7)
+        await b.flush()
+        assert online(a) == online(b) == []
+        assert [(p["online"], p["offline"]) for p in cluster.delivered] == [
+            ([{"id": 7, "username": "alice"}], []),
+            ([], [{"id": 7, "username": "alice"}]),
+        ]
+    asyncio.run(run())
+
+
+def test_sync_brings_a_new_worker_up_to_date():
+    async def run():
+        cluster = Cluster(1)
+        a = cluster.workers[0]
+        a.connected(1, 7, "alice")
+        await a.flush()
+        late = PresenceTracker(cluster.publish)
+        cluster.workers.append(late)
+        assert online(late) == []
+        await a.sync()
+        assert online(late) == [7]
+    asyncio.run(run())
+
+
+def test_silent_workers_are_forgotten():
+    async def run():
+        cluster = Cluster(2, sync_ms=10)
+        a, b = cluster.workers
+        a.connected(1, 7, "alice")
+        await a.flush()
+        assert online(b) == [7]
+        await asyncio.sleep(0.05)  # a stops publishing, as if it had crashed
+        await b.sync()
+        assert online(b) == []
+    asyncio.run(run())
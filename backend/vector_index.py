@@ -0,0 +1,93 @@
+"""
+FAISS index construction for the FAQ bot: flat, IVF, HNSW and PQ indexes with stable ids
+"""
+import math
+import os
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq")
+
+BOT_INDEX_TYPE = os.getenv("BOT_INDEX_TYPE", "flat")
+# "cosine" normalizes vectors and searches by inner product; "l2" keeps raw Euclidean distance
+BOT_METRIC = os.getenv("BOT_METRIC", "cosine")
+BOT_IVF_NLIST = int(os.getenv("BOT_IVF_NLIST", "0"))  # 0 picks ~4*sqrt(n) lists
+BOT_IVF_NPROBE = int(os.getenv("BOT_IVF_NPROBE", "8"))
+BOT_HNSW_M = int(os.getenv("BOT_HNSW_M", "32"))
+BOT_HNSW_EF_CONSTRUCTION = int(os.getenv("BOT_HNSW_EF_CONSTRUCTION", "80"))
+BOT_HNSW_EF_SEARCH = int(os.getenv("BOT_HNSW_EF_SEARCH", "64"))
+BOT_PQ_M = int(os.getenv("BOT_PQ_M", "8"))  # Sub-quantizers; must divide the dimension
+BOT_PQ_NBITS = int(os.getenv("BOT_PQ_NBITS", "8"))
+
+# Rough minimum training points per centroid before k-means results are usable
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so inner product equals cosine similarity"""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def prepare(vectors: np.ndarray, metric: str = BOT_METRIC) -> np.ndarray:
+    """Vectors in the form the index expects for `metric`"""
+    if metric == "cosine":
+        return normalize(vectors)
+    return np.ascontiguousarray(vectors, dtype="float32")
+
+
+def supports_remove(index_type: str) -> bool:
+    # HNSW graphs can't drop nodes; removed ids are filtered out at search time instead
+    return index_type != "hnsw"
+
+
+def effective_index_type(index_type: str, count: int, dimension: int) -> str:
+    """The index type actually built: IVF and PQ need enough vectors to train on"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    if index_type == "ivf" and count < 2 * _MIN_POINTS_PER_CENTROID:
+        return "flat"
+    if index_type == "pq" and (dimension % BOT_PQ_M or count < _MIN_POINTS_PER_CENTROID * (1 << BOT_PQ_NBITS)):
+        return "flat"
+    return index_type
+
+
+def build_index(vectors: np.ndarray, ids: np.ndarray, index_type: str = BOT_INDEX_TYPE,
+                metric: str = BOT_METRIC):
+    """Build (and train, if needed) an index over already-prepared vectors, keyed by `ids`.
+
+    Every index type accepts `add_with_ids`, so entries can be added later
+    without retraining; IVF and PQ keep their trained centroids.
+    """
+    count, dimension = vectors.shape
+    index_type = effective_index_type(index_type, count, dimension)
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+    if index_type == "ivf":
+        nlist = BOT_IVF_NLIST or int(4 * math.sqrt(count))
+        nlist = max(1, min(nlist, count // _MIN_POINTS_PER_CENTROID))
+        quantizer = faiss.IndexFlat(dimension, faiss_metric)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss_metric)
+        index.train(vectors)
+        index.nprobe = min(BOT_IVF_NPROBE, nlist)
+    elif index_type == "hnsw":
+        base = faiss.IndexHNSWFlat(dimension, BOT_HNSW_M, faiss_metric)
+        base.hnsw.efConstruction = BOT_HNSW_EF_CONSTRUCTION
+        base.hnsw.efSearch = BOT_HNSW_EF_SEARCH
+        index = faiss.IndexIDMap2(base)
+    elif index_type == "pq":
+        base = faiss.IndexPQ(dimension, BOT_PQ_M, BOT_PQ_NBITS, faiss_metric)
+        base.train(vectors)
+        index = faiss.IndexIDMap2(base)
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlat(dimension, faiss_metric))
+
+    if count:
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype="int64"))
+    return index, index_type
@@ -1,24 +1,86 @@
 import { useEffect, useRef, useState, useCallback } from 'react';
 import { useAuthStore } from '@/stores/authStore';
 
+export interface AttachmentPreview {
+  url: string;
+  filename?: string | null;
+  mime_type?: string | null;
+  size?: number | null;
+  width?: number | null;
+  height?: number | null;
+  thumbnail_url?: string | null;
+}
+
 export interface ChatMessage {
   id?: number;
   username: string;
   content: string;
   timestamp: string;
   file_url?: string | null;
+  attachment?: AttachmentPreview | null;
   type?: string;
 }
 
+export interface PresenceUser {
+  id: number;
+  username: string;
+}
+
 const API_BASE_URL = (import.meta as any).env.VITE_API_URL || 'http://127.0.0.1:8000';
 
+// The server ignores typing frames sent closer together than this
+const TYPING_THROTTLE_MS = 1000;
+const RECONNECT_DELAY_MS = 1000;
+// Catching up after a failed resume pages forward this far before giving up and reloading
+const CATCH_UP_PAGE_SIZE = 100;
+const MAX_CATCH_UP_PAGES = 10;
+
+// History pages list messages with their owner; live events carry the username directly
+const toChatMessage = (msg: any): ChatMessage => ({
+  id: msg.id,
+  username: msg.owner.username,
+  content: msg.content,
+  timestamp: msg.timestamp || new Date().toISOString(),
+  file_url: msg.file_url,
+  attachment: msg.attachment,
+  type: 'message',
+});
+
 export function useWebSocket(channelId: number) {
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [typingUsers, setTypingUsers] = useState<Set<string>>(new Set());
   const [isLoading, setIsLoading] = useState(true);
   const ws = useRef<WebSocket | null>(null);
   const token = useAuthStore((state) => state.token);
-  const typingTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+  const currentUserId = useRef<number | null>(null);
+  const lastTypingSent = useRef(0);
+  // Where this channel's event stream stood, so a dropped socket can resume instead of reloading
+  const position = useRef<{ epoch: string; seq: number } | null>(null);
+  // Newest message shown; message ids are shared by every server, unlike the epoch
+  const lastMessageId = useRef<number | null>(null);
+
+  // Typing updates list everyone in the channel; leave ourselves out
+  const showTyping = useCallback((users: PresenceUser[]) => {
+    setTypingUsers(new Set(users.filter((u) => u.id !== currentUserId.current).map((u) => u.username)));
+  }, []);
+
+  // Who is already typing when we open the channel
+  const fetchPresence = useCallback(async () => {
+    if (!token) return;
+    const headers = { 'Authorization': `Bearer ${token}` };
+    try {
+      if (currentUserId.current === null) {
+        const me = await fetch(`${API_BASE_URL}/users/me`, { headers });
+        if (me.ok) currentUserId.current = (await me.json()).id;
+      }
+      const response = await fetch(`${API_BASE_URL}/channels/${channelId}/presence`, { headers });
+      if (response.ok) {
+        showTyping((await response.json()).typing);
+      }
+    } catch (error) {
+      console.error('Failed to fetch presence:', error);
+    }
+  }, [channelId, token, showTyping]);
 
   // Fetch message history
   const fetchMessageHistory = useCallback(async () => {
@@ -34,14 +96,9 @@ export function useWebSocket(channelId: number) {
       
       if (response.ok) {
         const data = await response.json();
-        setMessages(data.map((msg: any) => ({
-          id: msg.id,
-          username: msg.owner.username,
-          content: msg.content,
-          timestamp: msg.timestamp || new Date().toISOString(),
-          file_url: msg.file_url,
-          type: 'message',
-        })));
+        // History pages come back newest-first; the chat renders oldest-first
+        setMessages([...data.messages].reverse().map(toChatMessage));
+        lastMessageId.current = data.messages.length ? data.messages[0].id : null;
       }
     } catch (error) {
       console.error('Failed to fetch message history:', error);
@@ -50,65 +107,127 @@ export function useWebSocket(channelId: number) {
     }
   }, [channelId, token]);
 
+  // Fetch the messages sent after the newest one shown, e.g. when a reconnect could not be replayed
+  const fetchMissedMessages = useCallback(async () => {
+    if (!token) return;
+    if (lastMessageId.current === null) {
+      fetchMessageHistory();
+      return;
+    }
+
+    const missed: ChatMessage[] = [];
+    let after: number | null = lastMessageId.current;
+    try {
+      for (let page = 0; after !== null; page++) {
+        if (page === MAX_CATCH_UP_PAGES) {
+          // Too far behind to be worth paging through: start over from the latest history
+          fetchMessageHistory();
+          return;
+        }
+        const response = await fetch(
+          `${API_BASE_URL}/channels/${channelId}/messages?after=${after}&limit=${CATCH_UP_PAGE_SIZE}`,
+          { headers: { 'Authorization': `Bearer ${token}` } },
+        );
+        if (!response.ok) {
+          fetchMessageHistory();
+          return;
+        }
+        const data = await response.json();
+        missed.push(...[...data.messages].reverse().map(toChatMessage));
+        after = data.next_cursor;
+      }
+    } catch (error) {
+      console.error('Failed to fetch missed messages:', error);
+      return;
+    }
+    if (!missed.length) return;
+
+    lastMessageId.current = Math.max(lastMessageId.current ?? 0, missed[missed.length - 1].id!);
+    setMessages((prevMessages) => {
+      const seen = new Set(prevMessages.map((m) => m.id));
+      const fresh = missed.filter((m) => !seen.has(m.id));
+      if (!fresh.length) return prevMessages;
+      // Messages that already arrived on the new socket are newer; keep them after the gap
+      const at = prevMessages.findIndex((m) => m.id !== undefined && m.id > fresh[0].id!);
+      return at === -1
+        ? [...prevMessages, ...fresh]
+        : [...prevMessages.slice(0, at), ...fresh, ...prevMessages.slice(at)];
+    });
+  }, [channelId, token, fetchMessageHistory]);
+
   // Initialize WebSocket and fetch history on channel change
   useEffect(() => {
     if (!token) return;
 
     fetchMessageHistory();
+    setTypingUsers(new Set());
+    fetchPresence();
+    position.current = null;
+    lastMessageId.current = null;
 
-    const socket = new WebSocket(`ws://127.0.0.1:8000/ws/${channelId}?token=${token}`);
+    let closed = false;
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
 
-    socket.onopen = () => {
-      console.log(`WebSocket connected to channel ${channelId}`);
-    };
+    const connect = () => {
+      const resume = position.current ? `&epoch=${position.current.epoch}&seq=${position.current.seq}` : '';
+      const socket = new WebSocket(`ws://127.0.0.1:8000/ws/${channelId}?token=${token}${resume}`);
+
+      socket.onopen = () => {
+        console.log(`WebSocket connected to channel ${channelId}`);
+      };
+
+      socket.onmessage = (event) => {
+        try {
+          const message = JSON.parse(event.data);
 
-    socket.onmessage = (event) => {
-      try {
-        const message = JSON.parse(event.data);
-        
-        if (message.type === 'typing') {
-          setTypingUsers((prev) => {
-            const updated = new Set(prev);
-            updated.add(message.username);
-            return updated;
-          });
-          
-          // Clear typing indicator after 3 seconds
-          if (typingTimeoutRef.current) {
-            clearTimeout(typingTimeoutRef.current);
+          if (typeof message.seq === 'number' && position.current) {
+            position.current.seq = message.seq;
           }
-          typingTimeoutRef.current = setTimeout(() => {
-            setTypingUsers((prev) => {
-              const updated = new Set(prev);
-              updated.delete(message.username);
-              return updated;
-            });
-          }, 3000);
-        } else if (message.type === 'message' || message.type === 'user_joined' || message.type === 'user_left') {
-          setMessages((prevMessages) => [...prevMessages, message]);
+
+          if (message.type === 'session' || message.type === 'resumed') {
+            position.current = { epoch: message.epoch, seq: message.seq };
+          } else if (message.type === 'resume_failed') {
+            // The events are gone (or were numbered by another server): page in the missed messages by id
+            position.current = { epoch: message.epoch, seq: message.seq };
+            fetchMissedMessages();
+          } else if (message.type === 'typing_update') {
+            // The server expires indicators itself and sends the full list with every update
+            showTyping(message.typing);
+          } else if (message.type === 'message' || message.type === 'user_joined' || message.type === 'user_left') {
+            if (message.type === 'message' && typeof message.id === 'number') {
+              lastMessageId.current = Math.max(lastMessageId.current ?? 0, message.id);
+            }
+            setMessages((prevMessages) => [...prevMessages, message]);
+          }
+        } catch (error) {
+          console.error('Failed to parse message:', error);
         }
-      } catch (error) {
-        console.error('Failed to parse message:', error);
-      }
-    };
+      };
 
-    socket.onclose = () => {
-      console.log('WebSocket disconnected');
-    };
+      socket.onclose = () => {
+        console.log('WebSocket disconnected');
+        if (!closed) {
+          reconnectTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+        }
+      };
 
-    socket.onerror = (error) => {
-      console.error('WebSocket error:', error);
+      socket.onerror = (error) => {
+        console.error('WebSocket error:', error);
+      };
+
+      ws.current = socket;
     };
 
-    ws.current = socket;
+    connect();
 
     return () => {
-      socket.close();
-      if (typingTimeoutRef.current) {
-        clearTimeout(typingTimeoutRef.current);
+      closed = true;
+      if (reconnectTimer) {
+        clearTimeout(reconnectTimer);
       }
+      ws.current?.close();
     };
-  }, [channelId, token, fetchMessageHistory]);
+  }, [channelId, token, fetchMessageHistory, fetchMissedMessages, fetchPresence, showTyping]);
 
   const sendMessage = useCallback((message: string, file_url?: string) => {
     if (ws.current && ws.current.readyState === WebSocket.OPEN) {
@@ -118,11 +237,15 @@ export function useWebSocket(channelId: number) {
         file_url: file_url || null,
       };
       ws.current.send(JSON.stringify(payload));
+      lastTypingSent.current = 0;
     }
   }, []);
 
   const sendTypingIndicator = useCallback(() => {
+    const now = Date.now();
+    if (now - lastTypingSent.current < TYPING_THROTTLE_MS) return;
     if (ws.current && ws.current.readyState === WebSocket.OPEN) {
+      lastTypingSent.current = now;
       const payload = {
         type: 'typing',
       };
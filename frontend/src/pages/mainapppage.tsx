@@ -286,7 +286,17 @@ export default function MainAppPage() {
                       {msg.username}
                     </span>
                     <p className="text-gray-200">{msg.content}</p>
-                    {msg.file_url && (
+                    {msg.attachment?.thumbnail_url && (
+                      <a href={msg.file_url ?? undefined} target="_blank" rel="noopener noreferrer">
+                        <img
+                          src={msg.attachment.thumbnail_url}
+                          alt={msg.attachment.filename ?? ''}
+                          loading="lazy"
+                          className="mt-1 max-w-xs rounded"
+                        />
+                      </a>
+                    )}
+                    {msg.file_url && !msg.attachment?.thumbnail_url && (
                       <a
                         href={msg.file_url}
                         target="_blank"